@@ -10,18 +10,28 @@ import re
 import sys
 import time
 import struct
+import wave
 import pathlib
+import hashlib
+import subprocess
+import socket
+import csv
+import itertools
 from pathlib import Path
 import numpy as np
 from scipy.io import wavfile
-from scipy.signal import spectrogram
+from scipy.signal import spectrogram, lfilter, get_window
+from scipy.fft import rfft, rfftfreq
 import torch
 import torchaudio
 from openunmix.predict import separate
+from openunmix import utils as openunmix_utils
 from pydub import AudioSegment
+from pydub.utils import get_prober_name
 import yaml
 from collections import OrderedDict
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 #from tqdm import tqdm
 #import psutil
 import logging
@@ -167,6 +177,10 @@ class VMDFile:
     def add_morph_frame(self, name, frame, weight):
         self.morph_frames.append(VMDMorphFrame(name, frame, weight))
 
+    def add_morph_frames(self, names, frames, weights):
+        # Add many morph frames at once (names, frames and weights are lists of the same length)
+        self.morph_frames.extend(map(VMDMorphFrame, names, frames, weights))
+
     def get_morph_frames(self):
         return self.morph_frames
 
@@ -213,6 +227,32 @@ def optimize_vmd_data(vmd):
 
     vmd.morph_frames = sorted(optimized_frames, key=lambda f: f.frame)
 
+def optimized_vowel_frames(vowel_weights):
+    """
+    The morph frames optimize_vmd_data keeps of a [frames, vowels] array of vowel weights (in VOWEL_RANGES order),
+    worked out for the whole array at once. Returns (vowel_indices, frames) of the kept morph frames,
+    in the same order optimize_vmd_data leaves them in.
+    """
+    weights = vowel_weights.astype(np.float64) # compared like the weights of the morph frames are
+    frame_count = len(weights)
+    v1, v2, v3 = weights[2:frame_count - 2], weights[1:frame_count - 3], weights[3:frame_count - 1] # each frame, the one before and the one after
+    is_keyframe = ((v1 > v2) & (v1 > v3)) | ((v1 < v2) & (v1 < v3)) | \
+                  ((v1 == 0) & ((v2 != 0) | (v3 != 0))) | ((v1 == 1) & ((v2 != 1) | (v3 != 1))) | \
+                  ((v1 < 0.0099) & (((v2 > 0.0099) & (v2 > v1)) | ((v3 > 0.0099) & (v3 > v1))))
+    keep = is_keyframe & ~((v1 == 0) & (v2 == 0) & (v3 == 0))
+
+    all_frames = np.arange(frame_count)
+    vowel_indices = []
+    frames = []
+    for vowel_index in range(weights.shape[1]):
+        # the first two and last two frames are always kept
+        vowel_frames = np.concatenate([all_frames[:2], all_frames[-2:], 2 + np.flatnonzero(keep[:, vowel_index])])
+        frames.append(vowel_frames)
+        vowel_indices.append(np.full(len(vowel_frames), vowel_index))
+    frames = np.concatenate(frames)
+    order = np.argsort(frames, kind='stable') # sorted by frame like optimize_vmd_data
+    return np.concatenate(vowel_indices)[order], frames[order]
+
 def optimize_vmd_bones_and_morphs(vmd, position_tolerance=0.01, rotation_tolerance=0.01):
     # Safe Range for bone position/rotation tolerance: 0.001 to 0.01
     # Explanation: A tolerance of 0.001 ensures very high fidelity, but it might not reduce the file size significantly. Increasing it to 0.01 can still maintain acceptable visual quality while allowing more keyframes to be removed.
@@ -313,101 +353,1005 @@ def format_time(seconds):
         minutes, secs = divmod(seconds, 60)
         return f"{int(minutes)} minutes and {secs:.2f} seconds"
 
+# Loaded Open-Unmix separators, kept for the whole run so the model is only loaded once
+_separator_cache = {}
 
-def extract_vocals(audio_path, wav_path):
-    audio_path = os.path.normpath(audio_path)
-    wav_path = os.path.normpath(wav_path)
+def get_separation_device():
+    # Use CUDA for separation when it is available
+    return torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+def configure_torch_threads(intra_op_threads=0, inter_op_threads=0):
+    """
+    Set how many CPU threads torch uses for separation (0 keeps torch's default for that setting).
+
+    intra_op_threads is the number of threads used inside one operation (like the model's LSTM),
+    inter_op_threads is the number of operations that can run at the same time.
+    The inter-op threads can only be set before torch starts any parallel work, so call this early.
+    """
+    if intra_op_threads and intra_op_threads > 0:
+        torch.set_num_threads(int(intra_op_threads))
+    if inter_op_threads and inter_op_threads > 0:
+        try:
+            torch.set_num_interop_threads(int(inter_op_threads))
+        except RuntimeError as e:
+            print(f"Warning: could not set torch inter-op threads: {e}")
+
+class ExportableTargetModel(torch.nn.Module):
+    """
+    Same forward pass as an Open-Unmix target model, but written so it can be exported:
+    the reshapes use -1 for the number of frames instead of sizes read from the input,
+    so a traced/exported model works for any audio length (and batch size).
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        model = self.model
+        # (nb_samples, nb_channels, nb_bins, nb_frames) -> (nb_frames, nb_samples, nb_channels, nb_bins)
+        x = x.permute(3, 0, 1, 2)
+        mix = x
+        nb_samples = x.shape[1]
+        nb_channels = x.shape[2]
+
+        x = x[..., :model.nb_bins]
+        x = x + model.input_mean
+        x = x * model.input_scale
+
+        x = model.fc1(x.reshape(-1, nb_channels * model.nb_bins))
+        x = model.bn1(x)
+        x = x.reshape(-1, nb_samples, model.hidden_size)
+        x = torch.tanh(x)
+
+        lstm_out = model.lstm(x)
+        x = torch.cat([x, lstm_out[0]], -1)
+
+        x = model.fc2(x.reshape(-1, x.shape[-1]))
+        x = model.bn2(x)
+        x = torch.nn.functional.relu(x)
+        x = model.fc3(x)
+        x = model.bn3(x)
+        x = x.reshape(-1, nb_samples, nb_channels, model.nb_output_bins)
+
+        x = x * model.output_scale
+        x = x + model.output_mean
+        x = torch.nn.functional.relu(x) * mix
+        return x.permute(1, 2, 3, 0)
+
+class BFloat16TargetModel(torch.nn.Module):
+    # Runs a target model in bfloat16, taking and returning float32 like the original model
+    def __init__(self, model):
+        super().__init__()
+        self.model = model.to(torch.bfloat16)
+
+    def forward(self, x):
+        return self.model(x.to(torch.bfloat16)).to(x.dtype)
+
+class OnnxTargetModel(torch.nn.Module):
+    # Runs an exported ONNX target model with onnxruntime, in place of the torch target model
+    def __init__(self, onnx_path):
+        super().__init__()
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The 'onnx' separator_backend needs onnxruntime, install it with: pip install onnxruntime")
+        self.session = onnxruntime.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+
+    def forward(self, x):
+        output = self.session.run(None, {'spectrogram': x.detach().cpu().numpy().astype(np.float32)})[0]
+        return torch.from_numpy(output).to(x.device)
+
+def export_target_model(model, export_path, backend="torchscript", precision="float32"):
+    """
+    Export an Open-Unmix target model to export_path, for the 'torchscript' or 'onnx' separator_backend.
+    precision can be float32, int8 (dynamic quantization of the LSTM and linear layers) or bfloat16 (torchscript only).
+    """
+    model = ExportableTargetModel(model).eval()
+    # a short example input, the exported model works for any number of frames
+    nb_channels = model.model.fc1.in_features // model.model.nb_bins
+    example_input = torch.rand(1, nb_channels, model.model.nb_output_bins, 64)
+    os.makedirs(os.path.dirname(export_path) or ".", exist_ok=True)
+    with torch.no_grad():
+        if backend == "torchscript":
+            if precision == "int8":
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8)
+            elif precision == "bfloat16":
+                model = BFloat16TargetModel(model)
+            traced = torch.jit.trace(model, (example_input,), check_trace=False)
+            traced.save(export_path)
+        elif backend == "onnx":
+            if precision == "bfloat16":
+                raise ValueError("bfloat16 separator_precision is not supported with the 'onnx' separator_backend, use float32 or int8")
+            float_path = export_path if precision == "float32" else export_path + ".float32.onnx"
+            torch.onnx.export(
+                model, (example_input,), float_path,
+                input_names=['spectrogram'], output_names=['target'],
+                dynamic_axes={'spectrogram': {0: 'samples', 3: 'frames'}, 'target': {0: 'samples', 3: 'frames'}},
+                dynamo=False
+            )
+            if precision == "int8":
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(float_path, export_path, weight_type=QuantType.QInt8)
+                for path in (float_path, float_path + ".data"):
+                    if os.path.exists(path):
+                        os.remove(path)
+        else:
+            raise ValueError(f"Invalid separator_backend option: {backend}")
+
+def get_backend_target_model(model, target, model_str_or_path="umxl", backend="eager", precision="float32", export_dir="exported_models"):
+    """
+    Get the target model to use for the separator_backend/separator_precision settings.
+
+    'eager' runs the torch model directly (quantized or cast when asked for), 'torchscript' and 'onnx'
+    export the model to export_dir the first time and load that export from then on.
+    """
+    if precision not in ("float32", "int8", "bfloat16"):
+        raise ValueError(f"Invalid separator_precision option: {precision}")
+    if backend == "eager":
+        if precision == "int8":
+            return torch.ao.quantization.quantize_dynamic(model, {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8)
+        if precision == "bfloat16":
+            return BFloat16TargetModel(model)
+        return model
+    if backend not in ("torchscript", "onnx"):
+        raise ValueError(f"Invalid separator_backend option: {backend}")
+
+    model_name = os.path.splitext(os.path.basename(str(model_str_or_path).rstrip("/\\")))[0]
+    extension = "pt" if backend == "torchscript" else "onnx"
+    export_path = os.path.join(export_dir or ".", f"{model_name}_{target}_{backend}_{precision}.{extension}")
+    if not os.path.exists(export_path):
+        print(f"Exporting the '{target}' model for the {backend} backend ({precision}) to {export_path} (only done once)...")
+        export_target_model(model, export_path, backend, precision)
+    if backend == "torchscript":
+        return torch.jit.load(export_path, map_location="cpu").eval()
+    return OnnxTargetModel(export_path)
+
+def get_separator(model_str_or_path="umxl", targets=("vocals",), residual=True, niter=1, wiener_win_len=300, device=None,
+                  backend="eager", precision="float32", export_dir="exported_models"):
+    """
+    Get an Open-Unmix separator, loading it only the first time it's asked for.
 
-    if not os.path.exists(audio_path):
-        raise FileNotFoundError(f"Specified audio file does not exist: {audio_path}")
+    The separator is cached per model/settings/device, so every file (and every split part)
+    in a batch reuses the same loaded model instead of reloading it on each separate() call.
+    Use release_separators() to free the memory again.
 
+    backend/precision pick how the target models run (see get_backend_target_model).
+    Anything other than eager float32 is meant for CPU inference, so it always uses the CPU.
+    """
+    if device is None:
+        device = get_separation_device()
+    if (backend != "eager" or precision != "float32") and torch.device(device).type != "cpu":
+        print(f"Note: the {backend} separator backend with {precision} precision runs on the CPU.")
+        device = torch.device('cpu')
+    cache_key = (str(model_str_or_path), tuple(targets), residual, niter, wiener_win_len, str(device), backend, precision)
+    separator = _separator_cache.get(cache_key)
+    if separator is None:
+        print(f"Loading separation model '{model_str_or_path}' on {device} (only done once per run)...")
+        separator = openunmix_utils.load_separator(
+            model_str_or_path=model_str_or_path,
+            targets=list(targets),
+            niter=niter,
+            residual=residual,
+            wiener_win_len=wiener_win_len,
+            device=device,
+            pretrained=True
+        )
+        separator.freeze()
+        separator.to(device)
+        if backend != "eager" or precision != "float32":
+            for target in list(separator.target_models.keys()):
+                separator.target_models[target] = get_backend_target_model(
+                    separator.target_models[target], target, model_str_or_path, backend, precision, export_dir)
+        _separator_cache[cache_key] = separator
+    return separator
+
+def release_separators():
+    # Unload all cached separators (frees the model memory, the next separation will load it again)
+    _separator_cache.clear()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def _probe_wav_header(audio_path):
+    """
+    Read the format and duration of a WAV file straight from its RIFF header.
+    Returns None if it's not a WAV file or the header is missing what's needed.
+    """
+    file_size = os.path.getsize(audio_path)
+    fmt = None
+    data_size = None
+    with open(audio_path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] not in (b'RIFF', b'RF64') or header[8:12] != b'WAVE':
+            return None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                break
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+            if chunk_id == b'fmt ':
+                fmt_data = f.read(chunk_size)
+                if len(fmt_data) < 16:
+                    return None
+                format_tag, channels, sample_rate, _, block_align, bits = struct.unpack('<HHIIHH', fmt_data[:16])
+                if format_tag == 0xFFFE and len(fmt_data) >= 26:
+                    # WAVE_FORMAT_EXTENSIBLE, the real format is at the start of the sub format GUID
+                    format_tag = struct.unpack('<H', fmt_data[24:26])[0]
+                fmt = (format_tag, channels, sample_rate, block_align, bits)
+                f.seek(chunk_size % 2, 1) # chunks are padded to an even size
+            elif chunk_id == b'data':
+                data_start = f.tell()
+                if chunk_size in (0, 0xFFFFFFFF) or data_start + chunk_size > file_size:
+                    # streamed or RF64 wavs (size not filled in) or a cut off file: the data goes to the end of the file
+                    data_size = file_size - data_start
+                else:
+                    data_size = chunk_size
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, 1)
+
+    if fmt is None or data_size is None:
+        return None
+    format_tag, channels, sample_rate, block_align, bits = fmt
+    if channels == 0 or sample_rate == 0 or block_align == 0:
+        return None
+    if format_tag == 1:
+        codec = 'pcm_u8' if bits == 8 else f"pcm_s{bits}le"
+    elif format_tag == 3:
+        codec = f"pcm_f{bits}le"
+    elif format_tag == 6:
+        codec = 'pcm_alaw'
+    elif format_tag == 7:
+        codec = 'pcm_mulaw'
+    else:
+        codec = f"wav_0x{format_tag:04x}"
+    return {
+        'duration': (data_size // block_align) / sample_rate,
+        'codec': codec,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'format': 'wav',
+        'source': 'header'
+    }
+
+def _probe_with_ffprobe(audio_path):
+    # Read the format and duration of any audio/video file from its container headers with ffprobe (None if that fails)
     try:
-        base_dir = str(pathlib.Path(wav_path).parent)
-        process_audio_dir = base_dir
+        result = subprocess.run(
+            [get_prober_name(), '-v', 'error', '-select_streams', 'a:0', '-show_format', '-show_streams', '-of', 'json', audio_path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+        )
+        info = json.loads(result.stdout.decode('utf-8', errors='ignore'))
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+    streams = info.get('streams') or []
+    if not streams:
+        return None # no audio stream
+    stream = streams[0]
+    container = info.get('format', {})
+    try:
+        duration = float(stream.get('duration') or container.get('duration'))
+        sample_rate = int(stream.get('sample_rate'))
+        channels = int(stream.get('channels'))
+    except (TypeError, ValueError):
+        return None # duration or format missing from the headers
+    if duration <= 0 or sample_rate <= 0 or channels <= 0:
+        return None
+    return {
+        'duration': duration,
+        'codec': stream.get('codec_name'),
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'format': container.get('format_name', '').split(',')[0],
+        'source': 'ffprobe'
+    }
 
-        if not os.path.exists(process_audio_dir):
-            os.makedirs(process_audio_dir)
+def probe_audio(audio_path):
+    """
+    Get the duration (in seconds), codec, sample rate, channel count and container format of an audio file
+    (path or DecodedAudio) without decoding it.
 
-        # Check if CUDA is available
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        print(f"Using device: {device}")
-        
-        # First try loading with torchaudio
+    WAV files are read from their RIFF header directly, other formats with ffprobe. Only when the headers
+    are missing or unusable is the audio decoded to get them (shared with the DecodedAudio, so that decode isn't wasted).
+    Returns a dict with 'duration', 'codec', 'sample_rate', 'channels', 'format' and 'source' (header/ffprobe/decode).
+    """
+    decoded_audio = get_decoded_audio(audio_path)
+    info = None
+    try:
+        info = _probe_wav_header(decoded_audio.path)
+    except OSError:
+        pass
+    if info is None:
+        info = _probe_with_ffprobe(decoded_audio.path)
+    if info is None:
+        segment = decoded_audio.segment
+        info = {
+            'duration': len(segment) / 1000.0,
+            'codec': None,
+            'sample_rate': segment.frame_rate,
+            'channels': segment.channels,
+            'format': os.path.splitext(decoded_audio.path)[1][1:].lower(),
+            'source': 'decode'
+        }
+    return info
+
+class DecodedAudio:
+    """
+    An input audio file that is decoded only once, shared by every step that needs its audio
+    (vocals analysis, separation, wav conversion and splitting).
+
+    The file is decoded the first time its audio is needed and the PCM is kept in memory after that,
+    so a long mp4 goes through ffmpeg once per run instead of once per step.
+    The duration and format come from the file headers (see probe_audio), so they don't decode it at all.
+    Every function that takes an audio file path also accepts a DecodedAudio.
+    """
+    def __init__(self, audio_path):
+        self.path = str(audio_path)
+        self._segment = None
+        self._info = None
+
+    @property
+    def segment(self):
+        # The decoded audio as a pydub AudioSegment (decoded on first use)
+        if self._segment is None:
+            self._segment = AudioSegment.from_file(self.path)
+        return self._segment
+
+    @property
+    def info(self):
+        # Duration, codec, sample rate, channels and format read from the file headers (see probe_audio)
+        if self._info is None:
+            self._info = probe_audio(self)
+        return self._info
+
+    @property
+    def source_format(self):
+        # file format (like "mp3", "wav"...)
+        return self.info['format']
+
+    @property
+    def sample_rate(self):
+        return self.segment.frame_rate if self._segment is not None else self.info['sample_rate']
+
+    @property
+    def channels(self):
+        return self.segment.channels if self._segment is not None else self.info['channels']
+
+    @property
+    def duration(self):
+        # Duration in seconds
+        if self._segment is not None:
+            return len(self._segment) / 1000.0
+        return self.info['duration']
+
+    @property
+    def is_decoded(self):
+        # True when the audio was already decoded (and is in memory)
+        return self._segment is not None
+
+    def segment_44100(self):
+        # The audio at 44100Hz (and 16-bit if it had to be resampled), like the wav files this script makes
+        if self.segment.frame_rate != 44100:
+            return self.segment.set_frame_rate(44100).set_sample_width(2)
+        return self.segment
+
+    def to_tensor(self):
+        # The audio as a [channels, samples] float tensor for Open-Unmix, and its sample rate
+        audio_segment = self.segment_44100()
+
+        # Convert to numpy array
+        samples = np.array(audio_segment.get_array_of_samples())
+
+        # Convert to float32 and normalize
+        if audio_segment.sample_width > 1:
+            samples = samples.astype(np.float32) / (2**(8 * audio_segment.sample_width - 1))
+        else:
+            samples = samples.astype(np.float32) / 255.0
+
+        # Handle stereo
+        if audio_segment.channels == 2:
+            samples = samples.reshape((-1, 2))
+
+        # Convert to torch tensor
+        audio = torch.from_numpy(samples)
+        if audio.dim() == 1:
+            audio = audio.unsqueeze(0)  # Add channel dimension
+        elif audio.dim() == 2 and audio.shape[1] == 2:
+            audio = audio.t()  # Convert to [channels, samples] format
+        return audio, audio_segment.frame_rate
+
+    def release(self):
+        # Free the decoded audio (it's decoded again if needed after this)
+        self._segment = None
+
+class InMemoryAudio(DecodedAudio):
+    """
+    Audio that only exists in memory, like the separated vocals when intermediate files aren't kept
+    (keep_intermediate_files). Works everywhere a DecodedAudio does, the VMD step reads its samples directly.
+
+    path is the name of the wav file it would have been saved as (used for naming the files made from it).
+    """
+    def __init__(self, audio_path, segment):
+        super().__init__(audio_path)
+        self._segment = segment
+        self.source_segment = segment
+        self.start_frame = 0
+        self.end_frame = int(segment.frame_count())
+
+    @property
+    def info(self):
+        if self._info is None:
+            sample_width = self.source_segment.sample_width
+            self._info = {
+                'duration': (self.end_frame - self.start_frame) / self.source_segment.frame_rate,
+                'codec': 'pcm_u8' if sample_width == 1 else f"pcm_s{8 * sample_width}le",
+                'sample_rate': self.source_segment.frame_rate,
+                'channels': self.source_segment.channels,
+                'format': 'wav',
+                'source': 'memory'
+            }
+        return self._info
+
+    def samples(self):
+        # The samples as wavfile.read would give them from the wav file (a view, not a copy)
+        source = self.source_segment
+        dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[source.sample_width]
+        samples = np.frombuffer(source.raw_data, dtype=dtype).reshape((-1, source.channels))
+        samples = samples[self.start_frame:self.end_frame]
+        missing_frames = (self.end_frame - self.start_frame) - len(samples)
+        if missing_frames > 0:
+            # pydub fills the end of a slice with up to 2ms of silence when it's rounded past the end
+            samples = np.concatenate([samples, np.zeros((missing_frames, source.channels), dtype=dtype)])
+        return samples[:, 0] if source.channels == 1 else samples
+
+    def release(self):
+        pass # there's no file to decode it again from
+
+class AudioPart(InMemoryAudio):
+    """
+    A part of a split audio file (see split_audio): a (start, end) view over the audio it was split from,
+    so the VMD step can read it straight from memory instead of from its own wav file.
+
+    path is the name of the part's wav file. That file only exists when the parts were exported
+    (export_split_parts), the part works the same without it.
+    """
+    def __init__(self, part_path, source_segment, start_ms, end_ms):
+        DecodedAudio.__init__(self, part_path)
+        self.source_segment = source_segment
+        # the same frames pydub picks for source_segment[start_ms:end_ms]
+        start_ms = min(start_ms, len(source_segment))
+        end_ms = min(end_ms, len(source_segment))
+        self.start_frame = int(start_ms * (source_segment.frame_rate / 1000.0))
+        self.end_frame = int(end_ms * (source_segment.frame_rate / 1000.0))
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+
+    @property
+    def segment(self):
+        if self._segment is None:
+            self._segment = self.source_segment[self.start_ms:self.end_ms]
+        return self._segment
+
+    def release(self):
+        self._segment = None # sliced again from the source audio if needed
+
+def get_decoded_audio(audio):
+    # Get a DecodedAudio for an audio file path, or the same DecodedAudio if one is given
+    if isinstance(audio, DecodedAudio):
+        return audio
+    return DecodedAudio(audio)
+
+def get_audio_path(audio):
+    # The file path of an audio file path or DecodedAudio
+    return audio.path if isinstance(audio, DecodedAudio) else audio
+
+def load_audio_for_separation(audio_path):
+    # Load an audio file (path or DecodedAudio) as a [channels, samples] float tensor for Open-Unmix
+    if isinstance(audio_path, DecodedAudio):
+        # already decoded (or decoded once here and kept for the next steps)
+        return audio_path.to_tensor()
+    # First try loading with torchaudio
+    try:
+        audio, sample_rate = torchaudio.load(audio_path)
+    except:
+        # If torchaudio fails, try loading with pydub and converting
+        print("Using pydub for audio loading (this is normal, both methods work equally well)...")
+        audio, sample_rate = DecodedAudio(audio_path).to_tensor()
+    return audio, sample_rate
+
+def get_separation_settings(config=None):
+    """
+    All the settings that change the separated vocals (also used for the vocals cache key).
+
+    'separation_profile' in config picks the preset:
+    - full: stereo separation with one Wiener filter iteration, vocals kept at the model's sample rate
+    - lipsync: faster separation only meant for making the VMD. The audio is downmixed to mono, the Wiener
+      filter iterations are skipped, and the vocals are resampled to 'lipsync_sample_rate' (default 12000),
+      which still covers the vowel bands (up to 2700Hz) the lip sync looks at
+    """
+    if config is None:
+        config = {}
+    profile = config.get('separation_profile', 'full')
+    if profile == 'lipsync':
+        settings = {'mono': True, 'niter': 0, 'output_sample_rate': int(config.get('lipsync_sample_rate', 12000))}
+    elif profile == 'full':
+        settings = {'mono': False, 'niter': 1, 'output_sample_rate': 0} # 0 = keep the model's sample rate
+    else:
+        raise ValueError(f"Invalid separation_profile option: {profile}")
+    settings.update({
+        'profile': profile,
+        'model': "umxl",
+        'wiener_win_len': 300,
+        'backend': config.get('separator_backend', 'eager'),
+        'precision': config.get('separator_precision', 'float32'),
+        'chunk_seconds': config.get('separation_chunk_seconds', 30),
+        'chunk_overlap_seconds': config.get('separation_chunk_overlap_seconds', 1)
+    })
+    return settings
+
+def get_vocals_cache_key(audio, sample_rate, config=None):
+    # Content address of a separation: hash of the decoded audio plus the separation settings
+    samples = audio.cpu().contiguous().numpy() if isinstance(audio, torch.Tensor) else np.ascontiguousarray(audio)
+    key_hash = hashlib.sha256()
+    key_hash.update(json.dumps(get_separation_settings(config), sort_keys=True).encode('utf-8'))
+    key_hash.update(f"{sample_rate}:{samples.dtype}:{samples.shape}".encode('utf-8'))
+    key_hash.update(memoryview(samples).cast('B'))
+    return key_hash.hexdigest()
+
+def load_cached_separation(cache_dir, cache_key):
+    """
+    Load separated vocals from the vocals cache, or return None if they aren't cached.
+    A cache hit also marks the entry as recently used (for the LRU eviction).
+    """
+    wav_path = os.path.join(cache_dir, f"{cache_key}.wav")
+    info_path = os.path.join(cache_dir, f"{cache_key}.json")
+    if not (os.path.exists(wav_path) and os.path.exists(info_path)):
+        return None
+    try:
+        with open(info_path, 'r') as f:
+            info = json.load(f)
+        sample_rate, vocals = wavfile.read(wav_path)
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not read cached vocals {wav_path}: {e}")
+        return None
+    os.utime(wav_path, None) # mark as recently used
+    vocals = torch.from_numpy(vocals)
+    vocals = vocals.t().contiguous() if vocals.dim() == 2 else vocals.unsqueeze(0)
+    return {
+        'vocals': vocals,
+        'sample_rate': sample_rate,
+        'vocal_energy': info['vocal_energy'],
+        'accompaniment_energy': info['accompaniment_energy']
+    }
+
+def save_cached_separation(cache_dir, cache_key, separated, max_size_mb=2048):
+    # Save separated vocals to the vocals cache, then evict the least recently used entries if it got too big
+    os.makedirs(cache_dir, exist_ok=True)
+    wav_path = os.path.join(cache_dir, f"{cache_key}.wav")
+    info_path = os.path.join(cache_dir, f"{cache_key}.json")
+    # both written whole first, the info before the wav, so another worker never reads half an entry
+    temp_path = f"{info_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump({
+            'vocal_energy': separated['vocal_energy'],
+            'accompaniment_energy': separated['accompaniment_energy']
+        }, f)
+    os.replace(temp_path, info_path)
+    # float32 like the separation gives them, so cached vocals are exactly the ones a new separation would give
+    vocals = separated['vocals'].cpu().numpy() if isinstance(separated['vocals'], torch.Tensor) else separated['vocals']
+    temp_path = f"{wav_path}.{os.getpid()}.tmp"
+    wavfile.write(temp_path, separated['sample_rate'], np.ascontiguousarray(np.atleast_2d(vocals).T, dtype=np.float32))
+    os.replace(temp_path, wav_path)
+    evict_cache(cache_dir, max_size_mb)
+
+def get_cache_dir(config, key, default):
+    # A cache folder from config (empty = cache off), a relative one is inside this script's folder wherever it's run from
+    cache_dir = config.get(key, default)
+    if cache_dir and not os.path.isabs(cache_dir):
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), cache_dir)
+    return cache_dir
+
+def evict_cache(cache_dir, max_size_mb=2048, extension='.wav'):
+    # Delete the least recently used cache entries (the files ending with extension, with their .json info) until the cache is at most max_size_mb
+    entries = []
+    total_size = 0
+    for filename in os.listdir(cache_dir):
+        if not filename.endswith(extension):
+            continue
+        entry_path = os.path.join(cache_dir, filename)
+        info_path = entry_path[:-len(extension)] + '.json'
         try:
-            audio, sample_rate = torchaudio.load(audio_path)
-        except:
-            # If torchaudio fails, try loading with pydub and converting
-            print("Using pydub for audio loading (this is normal, both methods work equally well)...")
-            audio_segment = AudioSegment.from_file(audio_path)
-
-            # Set the frame rate to 44100Hz (and sample width to 16-bit) if needed
-            if audio_segment.frame_rate != 44100:
-                #print(f"Sample rate is {audio_segment.frame_rate}, resampling to 44100Hz 16-bit")
-                audio_segment = audio_segment.set_frame_rate(44100).set_sample_width(2)
-            #else:
-            #    print(f"Sample rate is already 44100Hz, so no need to resample")
-            
-            # Convert to numpy array
-            samples = np.array(audio_segment.get_array_of_samples())
-            
-            # Convert to float32 and normalize
-            if audio_segment.sample_width > 1:
-                samples = samples.astype(np.float32) / (2**(8 * audio_segment.sample_width - 1))
-            else:
-                samples = samples.astype(np.float32) / 255.0
-            
-            # Handle stereo
-            if audio_segment.channels == 2:
-                samples = samples.reshape((-1, 2))
-            
-            # Convert to torch tensor
-            audio = torch.from_numpy(samples)
-            if audio.dim() == 1:
-                audio = audio.unsqueeze(0)  # Add channel dimension
-            elif audio.dim() == 2 and audio.shape[1] == 2:
-                audio = audio.t()  # Convert to [channels, samples] format
-            
-            sample_rate = audio_segment.frame_rate
-            
-        # Move audio to device
-        audio = audio.to(device)
-        
-        # Separate vocals using Open-Unmix
+            size = os.path.getsize(entry_path) + (os.path.getsize(info_path) if os.path.exists(info_path) else 0)
+            entries.append((os.path.getmtime(entry_path), size, entry_path, info_path))
+        except FileNotFoundError:
+            continue # deleted meanwhile (by another worker)
+        total_size += size
+
+    max_size = max_size_mb * 1024 * 1024
+    for _, size, entry_path, info_path in sorted(entries):
+        if total_size <= max_size:
+            break
+        for path in (entry_path, info_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass # already deleted (by another worker)
+        total_size -= size
+
+FEATURE_CACHE_VERSION = 2 # changed when the features of the same audio and settings change
+
+def get_file_content_hash(input_file, cache_dir):
+    """
+    The sha256 of the bytes of input_file. The hashes are remembered in cache_dir's file_hashes.json by the file's
+    path, size and modification time, so an unchanged file isn't read again (a changed one is hashed again).
+    """
+    index_path = os.path.join(cache_dir, "file_hashes.json")
+    file_path = os.path.abspath(input_file)
+    file_stat = os.stat(file_path)
+    try:
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    entry = index.get(file_path)
+    if entry and entry['size'] == file_stat.st_size and entry['mtime_ns'] == file_stat.st_mtime_ns:
+        return entry['sha256']
+
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            file_hash.update(block)
+    index = {path: entry for path, entry in index.items() if os.path.exists(path)} # forget deleted files
+    index[file_path] = {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns, 'sha256': file_hash.hexdigest()}
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f"{index_path}.{os.getpid()}.tmp" # written whole first, so another worker never reads half of it
+    with open(temp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(temp_path, index_path)
+    return file_hash.hexdigest()
+
+def get_feature_cache_key(input_file, config, cache_dir):
+    # Content address of the VMD features of an audio file: hash of the file's bytes (see get_file_content_hash) plus every
+    # setting that changes the features (not the weight multipliers and the smoothing, they're applied to the features after)
+    settings = {
+        'version': FEATURE_CACHE_VERSION,
+        'vocals_only_name': bool(re.search(r'_vocals_only(_part\d+)?$', os.path.splitext(os.path.basename(input_file))[0])),
+        'separate_vocals': config.get('separate_vocals', 'automatic'),
+        'vocal_prescreen': config.get('vocal_prescreen', True),
+        'separation': get_separation_settings(config),
+        'separation_batch_size': config.get('separation_batch_size', 1),
+        'separation_batch_max_seconds': config.get('separation_batch_max_seconds', 15),
+        'separation_batch_max_padding': config.get('separation_batch_max_padding', 0.1),
+        'max_duration': config.get('max_duration', 300),
+        'vmd_frame_rate': config.get('vmd_frame_rate', 30),
+        'analysis_window_size': config.get('analysis_window_size', 0),
+        'fast_band_energies': config.get('fast_band_energies', True)
+    }
+    key_hash = hashlib.sha256()
+    key_hash.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    key_hash.update(get_file_content_hash(input_file, cache_dir).encode('utf-8'))
+    return key_hash.hexdigest()
+
+def load_cached_features(cache_dir, cache_key):
+    """
+    Load the VMD features of an audio file from the feature cache, or return None if they aren't cached.
+    Returns {'parts': [(band_means, energy, max_Sxx) of each split part], 'unsplit': the same for the unsplit audio or None,
+    'vocals_separated': whether the vocals were separated from the audio}.
+    A cache hit also marks the entry as recently used (for the LRU eviction).
+    """
+    npz_path = os.path.join(cache_dir, f"{cache_key}.npz")
+    if not os.path.exists(npz_path):
+        return None
+    try:
+        with np.load(npz_path) as data:
+            features = {name: data[name] for name in data.files}
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not read cached features {npz_path}: {e}")
+        return None
+    os.utime(npz_path, None) # mark as recently used
+    def get_features(prefix):
+        return (features[f"{prefix}_band_means"], features[f"{prefix}_energy"], features[f"{prefix}_max_Sxx"][()])
+    return {
+        'parts': [get_features(f"part{i}") for i in range(int(features['part_count']))],
+        'unsplit': get_features("unsplit") if "unsplit_energy" in features else None,
+        'vocals_separated': bool(features['vocals_separated'])
+    }
+
+def save_cached_features(cache_dir, cache_key, part_features, unsplit_features=None, max_size_mb=256, vocals_separated=False):
+    # Save the VMD features of an audio file (see load_cached_features) to the feature cache, then evict the least recently used entries if it got too big
+    os.makedirs(cache_dir, exist_ok=True)
+    npz_path = os.path.join(cache_dir, f"{cache_key}.npz")
+    arrays = {'part_count': np.array(len(part_features)), 'vocals_separated': np.array(vocals_separated)}
+    for prefix, features in [(f"part{i}", features) for i, features in enumerate(part_features)] + ([("unsplit", unsplit_features)] if unsplit_features is not None else []):
+        arrays[f"{prefix}_band_means"], arrays[f"{prefix}_energy"], arrays[f"{prefix}_max_Sxx"] = features
+    temp_path = f"{npz_path}.{os.getpid()}.tmp" # written whole first, so another worker never reads half of it
+    with open(temp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temp_path, npz_path)
+    evict_cache(cache_dir, max_size_mb, extension='.npz')
+
+def separate_vocals(audio, sample_rate, device=None, config=None):
+    """
+    Separate a [channels, samples] audio tensor into vocals and residual (everything else).
+
+    If 'vocals_cache_dir' is set in config (default "vocals_cache"), results are cached there keyed by a hash of
+    the decoded audio and the separation settings, so the same audio is never separated twice, whatever its
+    filename or output folder. The cache is limited to 'vocals_cache_max_mb', least recently used entries are deleted.
+
+    Returns a dict with the 'vocals' tensor (on the CPU, shaped [channels, samples]), the 'sample_rate' it's in
+    (the separation model's rate) and the mean absolute 'vocal_energy' and 'accompaniment_energy'.
+    A fresh separation also has the 'residual' tensor.
+    This result can be given to extract_vocals() so the same audio isn't separated twice.
+    """
+    if config is None:
+        config = {}
+    cache_dir = get_cache_dir(config, 'vocals_cache_dir', "vocals_cache")
+    if cache_dir:
+        cache_key = get_vocals_cache_key(audio, sample_rate, config)
+        separated = load_cached_separation(cache_dir, cache_key)
+        if separated is not None:
+            print(f"-Using cached separated vocals (cache key {cache_key[:12]}...)")
+            return separated
+
+    separated = _run_separation(audio, sample_rate, device, config)
+    separated['vocal_energy'] = torch.mean(torch.abs(separated['vocals'])).item()
+    separated['accompaniment_energy'] = torch.mean(torch.abs(separated['residual'])).item()
+
+    if cache_dir:
+        save_cached_separation(cache_dir, cache_key, separated, config.get('vocals_cache_max_mb', 2048))
+    return separated
+
+def _run_separation(audio, sample_rate, device=None, config=None):
+    """
+    Run Open-Unmix on a [channels, samples] audio tensor, returning the 'vocals', 'residual' and 'sample_rate'.
+
+    Long audio is separated in chunks of 'separation_chunk_seconds' (from config, default 30, 0 = all at once)
+    that overlap by 'separation_chunk_overlap_seconds' and are crossfaded together, so the memory used by
+    the separation (STFT, model and Wiener filter intermediates) stays the same whatever the audio length.
+    The 'separation_profile' settings (see get_separation_settings) are applied too.
+    """
+    settings = get_separation_settings(config)
+    separator, device = _get_separator_for_settings(settings, device, config)
+    model_rate = int(separator.sample_rate)
+
+    chunk_length = int(settings['chunk_seconds'] * model_rate)
+    overlap_length = int(settings['chunk_overlap_seconds'] * model_rate)
+
+    # resample once here, so the chunks line up with the output samples
+    audio = _prepare_separation_input(audio, sample_rate, model_rate, settings)
+    audio_length = audio.shape[-1]
+
+    if chunk_length <= 0 or audio_length <= chunk_length:
+        # Separate vocals using Open-Unmix (reusing the already loaded model)
         separated = separate(
-            audio,
-            rate=sample_rate,
-            model_str_or_path="umxl",
-            targets=["vocals"],
-            residual=True,
+            audio.to(device),
+            rate=model_rate,
+            separator=separator,
             device=device
         )
-        
-        # Get vocals and convert back to CPU if needed
-        vocals = separated["vocals"].squeeze(0).cpu().numpy()
-        
-        # Convert to 16-bit PCM and scale appropriately
-        vocals = np.clip(vocals * 32768, -32768, 32767).astype(np.int16)
-        
-        # Create AudioSegment from numpy array
-        if vocals.ndim == 1:
-            # Mono audio
-            audio_segment = AudioSegment(
-                vocals.tobytes(), 
-                frame_rate=sample_rate,
-                sample_width=2,  # 16-bit
-                channels=1
+        vocals = separated["vocals"].squeeze(0).cpu()
+        residual = separated["residual"].squeeze(0).cpu()
+        del separated
+    else:
+        overlap_length = min(max(overlap_length, 0), chunk_length // 2)
+        hop_length = chunk_length - overlap_length
+        fade_in = torch.linspace(0.5 / max(overlap_length, 1), 1 - 0.5 / max(overlap_length, 1), overlap_length)
+        fade_out = 1 - fade_in
+        vocals = torch.zeros((2, audio_length))
+        residual = torch.zeros((2, audio_length))
+
+        chunk_start = 0
+        while True:
+            chunk_end = min(chunk_start + chunk_length, audio_length)
+            is_last_chunk = chunk_end == audio_length
+
+            separated = separate(
+                audio[..., chunk_start:chunk_end].to(device),
+                rate=model_rate,
+                separator=separator,
+                device=device
             )
+            chunk_vocals = separated["vocals"].squeeze(0).cpu()
+            chunk_residual = separated["residual"].squeeze(0).cpu()
+            del separated
+
+            # crossfade with the chunk before and after (the fades add up to 1 in the overlaps)
+            if chunk_start > 0 and overlap_length > 0:
+                chunk_vocals[..., :overlap_length] *= fade_in
+                chunk_residual[..., :overlap_length] *= fade_in
+            if not is_last_chunk and overlap_length > 0:
+                chunk_vocals[..., -overlap_length:] *= fade_out
+                chunk_residual[..., -overlap_length:] *= fade_out
+            vocals[..., chunk_start:chunk_end] += chunk_vocals
+            residual[..., chunk_start:chunk_end] += chunk_residual
+
+            if is_last_chunk:
+                break
+            chunk_start += hop_length
+
+    return _finish_separation(vocals, residual, model_rate, settings)
+
+def _get_separator_for_settings(settings, device=None, config=None):
+    # Get the cached separator for the separation settings, and the device it runs on
+    if device is None:
+        device = get_separation_device()
+    if settings['backend'] != 'eager' or settings['precision'] != 'float32':
+        device = torch.device('cpu') # exported and quantized models run on the CPU
+    export_dir = (config or {}).get('exported_models_dir', "exported_models")
+    separator = get_separator(niter=settings['niter'], wiener_win_len=settings['wiener_win_len'], device=device,
+                              backend=settings['backend'], precision=settings['precision'], export_dir=export_dir)
+    return separator, device
+
+def _prepare_separation_input(audio, sample_rate, model_rate, settings):
+    # Make a [channels, samples] tensor ready for the model: mono downmix (lipsync profile) and resampling to the model's rate
+    if audio.dim() == 1:
+        audio = audio.unsqueeze(0)  # Add channel dimension
+    if settings['mono'] and audio.shape[0] > 1:
+        audio = torch.mean(audio, dim=0, keepdim=True)
+    if sample_rate != model_rate:
+        audio = torchaudio.functional.resample(audio, sample_rate, model_rate)
+    return audio
+
+def _finish_separation(vocals, residual, model_rate, settings):
+    # Apply the profile's output settings to separated vocals/residual and make the separation result dict
+    output_sample_rate = model_rate
+    if settings['mono']:
+        # the model always outputs stereo (mono input is duplicated), so mix it back to one channel
+        vocals = torch.mean(vocals, dim=0, keepdim=True)
+        residual = torch.mean(residual, dim=0, keepdim=True)
+    if settings['output_sample_rate'] and settings['output_sample_rate'] != model_rate:
+        output_sample_rate = settings['output_sample_rate']
+        vocals = torchaudio.functional.resample(vocals, model_rate, output_sample_rate)
+        residual = torchaudio.functional.resample(residual, model_rate, output_sample_rate)
+
+    return {
+        'vocals': vocals,
+        'residual': residual,
+        'sample_rate': output_sample_rate
+    }
+
+def separate_vocals_batch(audios, sample_rates, device=None, config=None):
+    """
+    Separate a list of short [channels, samples] audio tensors, many clips per forward pass of the model.
+
+    Clips of similar length are padded with silence to the longest one, stacked into one batch and
+    separated together, then each clip's vocals/residual are cut back to its own length. This removes
+    the per-call overhead (tensor setup, model dispatch) that dominates with many short clips.
+
+    The results are close to, but not the same as, separating each clip on its own: the model's LSTM is
+    bidirectional (and the Wiener filter looks at every frame), so the silence padding at the end changes
+    the separation over the whole clip, not only near its end. To keep that small, a clip only gets up to
+    'separation_batch_max_padding' (a fraction of its length) of padding, 0 only batches clips of the same length.
+
+    Cached clips are taken from the vocals cache, the others are cached after separating.
+    Returns a list with one separation result (like separate_vocals()) per clip.
+    """
+    if config is None:
+        config = {}
+    results = [None] * len(audios)
+    cache_dir = get_cache_dir(config, 'vocals_cache_dir', "vocals_cache")
+    cache_keys = [None] * len(audios)
+    if cache_dir:
+        for i, (audio, sample_rate) in enumerate(zip(audios, sample_rates)):
+            cache_keys[i] = get_vocals_cache_key(audio, sample_rate, config)
+            results[i] = load_cached_separation(cache_dir, cache_keys[i])
+    to_separate = [i for i in range(len(audios)) if results[i] is None]
+    if not to_separate:
+        return results
+
+    settings = get_separation_settings(config)
+    separator, device = _get_separator_for_settings(settings, device, config)
+    model_rate = int(separator.sample_rate)
+
+    clips = {}
+    for i in to_separate:
+        clip = _prepare_separation_input(audios[i], sample_rates[i], model_rate, settings)
+        if not settings['mono']:
+            clip = clip[:2] if clip.shape[0] >= 2 else clip.repeat(2, 1) # every clip in the batch needs the same channels
+        clips[i] = clip
+
+    # Group clips of similar length (sorted shortest first), so the shortest clip of a batch is padded by at most max_padding of its length
+    max_padding = config.get('separation_batch_max_padding', 0.1)
+    batches = []
+    for i in sorted(to_separate, key=lambda i: clips[i].shape[-1]):
+        clip_length = clips[i].shape[-1]
+        if batches and clip_length <= clips[batches[-1][0]].shape[-1] * (1 + max_padding):
+            batches[-1].append(i)
+            continue
+        batches.append([i])
+
+    for batch_indices in batches:
+        batch_length = clips[batch_indices[-1]].shape[-1]
+        batch = torch.zeros((len(batch_indices), clips[batch_indices[0]].shape[0], batch_length))
+        for j, i in enumerate(batch_indices):
+            batch[j, :, :clips[i].shape[-1]] = clips[i]
+
+        print(f"-Separating {len(batch_indices)} clips in one batch ({batch_length / model_rate:.1f} seconds each with padding)")
+        separated = separate(batch.to(device), rate=model_rate, separator=separator, device=device)
+        batch_vocals = separated["vocals"].cpu()
+        batch_residual = separated["residual"].cpu()
+        del separated, batch
+
+        for j, i in enumerate(batch_indices):
+            clip_length = clips[i].shape[-1]
+            result = _finish_separation(batch_vocals[j, :, :clip_length].clone(), batch_residual[j, :, :clip_length].clone(), model_rate, settings)
+            result['vocal_energy'] = torch.mean(torch.abs(result['vocals'])).item()
+            result['accompaniment_energy'] = torch.mean(torch.abs(result['residual'])).item()
+            if cache_dir:
+                save_cached_separation(cache_dir, cache_keys[i], result, config.get('vocals_cache_max_mb', 2048))
+            results[i] = result
+        del batch_vocals, batch_residual
+    return results
+
+def vocals_to_segment(vocals, sample_rate):
+    # Convert a separated vocals tensor/array ([channels, samples] or [samples]) to a 16-bit AudioSegment
+    if isinstance(vocals, torch.Tensor):
+        vocals = vocals.numpy()
+
+    # Convert to 16-bit PCM and scale appropriately
+    vocals = np.clip(vocals * 32768, -32768, 32767).astype(np.int16)
+    
+    # Create AudioSegment from numpy array
+    if vocals.ndim == 1:
+        # Mono audio
+        audio_segment = AudioSegment(
+            vocals.tobytes(), 
+            frame_rate=sample_rate,
+            sample_width=2,  # 16-bit
+            channels=1
+        )
+    else:
+        # Stereo audio
+        audio_segment = AudioSegment(
+            vocals.T.tobytes(), 
+            frame_rate=sample_rate,
+            sample_width=2,  # 16-bit
+            channels=vocals.shape[0]
+        )
+    return audio_segment
+
+def save_vocals_wav(vocals, sample_rate, wav_path):
+    # Save a separated vocals tensor/array ([channels, samples] or [samples]) as a 16-bit wav
+    vocals_to_segment(vocals, sample_rate).export(wav_path, format="wav")
+
+def extract_vocals(audio_path, wav_path, separated=None, config=None, keep_file=True):
+    """
+    Extract the vocals from an audio file and save them as a wav file.
+
+    If separated is given (the separation result returned by analyze_audio_for_vocals() or
+    separate_vocals() for this same file), it's used directly instead of separating the audio again.
+    With keep_file=False nothing is saved, the vocals are returned as an InMemoryAudio named wav_path instead.
+    """
+    if not isinstance(audio_path, DecodedAudio):
+        audio_path = os.path.normpath(audio_path)
+    wav_path = os.path.normpath(wav_path)
+
+    if not os.path.exists(get_audio_path(audio_path)):
+        raise FileNotFoundError(f"Specified audio file does not exist: {get_audio_path(audio_path)}")
+
+    try:
+        base_dir = str(pathlib.Path(wav_path).parent)
+        process_audio_dir = base_dir
+
+        if keep_file and not os.path.exists(process_audio_dir):
+            os.makedirs(process_audio_dir)
+
+        if separated is None:
+            # Check if CUDA is available
+            device = get_separation_device()
+            print(f"Using device: {device}")
+            
+            audio, sample_rate = load_audio_for_separation(audio_path)
+            separated = separate_vocals(audio, sample_rate, device, config)
+            del audio
         else:
-            # Stereo audio
-            audio_segment = AudioSegment(
-                vocals.T.tobytes(), 
-                frame_rate=sample_rate,
-                sample_width=2,  # 16-bit
-                channels=vocals.shape[0]
-            )
-        
-        # Export as WAV
-        audio_segment.export(wav_path, format="wav")
+            print("Reusing the vocals already separated during analysis (no need to separate again)")
+
+        if not keep_file:
+            print("Vocals separated (kept in memory)")
+            return InMemoryAudio(wav_path, vocals_to_segment(separated['vocals'], separated['sample_rate']))
+
+        save_vocals_wav(separated['vocals'], separated['sample_rate'], wav_path)
 
         print(f"Vocals separated and saved to: {wav_path}")
         return wav_path
@@ -426,20 +1370,14 @@ def get_audio_duration(audio_path, return_as_text=False):
     Get the duration of an audio file.
 
     Parameters:
-    audio_path (str): Path to the audio file.
+    audio_path (str or DecodedAudio): Path to the audio file, or the already decoded audio.
     return_as_text (bool): If True, returns the duration formatted as a readable string.
 
     Returns:
     float or str: Duration of the audio file in seconds, or a formatted string if return_as_text is True.
     """
-    # Load the audio file
-    audio = AudioSegment.from_file(audio_path)
-    
-    # Get the duration in milliseconds
-    duration_ms = len(audio)
-    
-    # Convert to seconds
-    duration_s = duration_ms / 1000.0
+    # Read the duration from the file headers (only decoded when they don't have it)
+    duration_s = get_decoded_audio(audio_path).duration
     
     if return_as_text:
         # Calculate hours, minutes, and seconds
@@ -460,75 +1398,160 @@ def get_audio_duration(audio_path, return_as_text=False):
     
     return duration_s #return duration in seconds
 
-def analyze_audio_for_vocals(audio_path):
-    #check if audio has voice in it, and also if it's a vocals-only file
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    
-    # First try loading with torchaudio
-    try:
-        audio, sample_rate = torchaudio.load(audio_path)
-    except:
-        # If torchaudio fails, try loading with pydub and converting
-        print("Torchaudio failed to load audio for analysis, trying pydub...")
-        print("Using pydub for audio analysis instead of Torchaudio (this is normal, both methods work well)...")
-        audio_segment = AudioSegment.from_file(audio_path)
+def get_vocal_presence_statistics(audio, sample_rate, frame_size=2048, max_frames=20000):
+    """
+    Cheap spectral statistics used to pre-screen audio for vocals (no separation needed).
+
+    Returns a dict with:
+    - mean_amplitude: average absolute amplitude of the audio
+    - pause_ratio: fraction of frames that are near-silent compared to the loud parts (speech has many pauses, music usually doesn't)
+    - low_band_ratio: fraction of the energy below 90Hz (bass/kick drums, almost none in speech)
+    - voice_band_ratio: fraction of the energy between 90Hz and 4000Hz (where almost all speech energy is)
+    - spectral_stability: median similarity of the voice band spectra of neighboring loud frames (1 = the same sound held,
+      like a played note; speech keeps moving its pitch and formants, so it's well under 1)
+    At most max_frames evenly spread frames (in pairs of neighbors) are looked at, so long files take the same time as short ones.
+    """
+    if isinstance(audio, torch.Tensor):
+        audio = audio.cpu().numpy()
+    mono = np.mean(audio, axis=0, dtype=np.float32) if audio.ndim > 1 else audio.astype(np.float32)
+
+    frame_count = len(mono) // frame_size
+    if frame_count == 0:
+        return None
+    frames = mono[:frame_count * frame_size].reshape(frame_count, frame_size)
+    if frame_count > max_frames:
+        pair_starts = np.linspace(0, frame_count - 2, max_frames // 2).astype(int)
+        frames = frames[np.stack([pair_starts, pair_starts + 1], axis=1).ravel()]
+
+    frame_rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    loud_rms = np.percentile(frame_rms, 95)
+    frame_power = np.abs(np.fft.rfft(frames * np.hanning(frame_size).astype(np.float32), axis=1)) ** 2
+    power = np.sum(frame_power, axis=0)
+    freqs = np.fft.rfftfreq(frame_size, 1 / sample_rate)
+    total_power = np.sum(power[1:]) # without the DC bin
+    if loud_rms <= 0 or total_power <= 0:
+        return {'mean_amplitude': 0.0, 'pause_ratio': 1.0, 'low_band_ratio': 0.0, 'voice_band_ratio': 0.0, 'spectral_stability': 1.0}
+
+    # Cosine similarity of the voice band magnitude spectra of frames 2i and 2i+1, where both are loud (within ~20dB of the loud parts)
+    pair_count = len(frames) // 2
+    voice_band = np.sqrt(frame_power[:pair_count * 2, (freqs >= 90) & (freqs <= 4000)])
+    first, second = voice_band[0::2], voice_band[1::2]
+    is_loud_pair = (frame_rms[0:pair_count * 2:2] >= loud_rms * 0.1) & (frame_rms[1:pair_count * 2:2] >= loud_rms * 0.1)
+    similarities = np.sum(first * second, axis=1)[is_loud_pair] / np.sqrt(np.sum(first ** 2, axis=1) * np.sum(second ** 2, axis=1))[is_loud_pair]
+
+    return {
+        'mean_amplitude': float(np.mean(np.abs(mono))),
+        'pause_ratio': float(np.mean(frame_rms < loud_rms * 0.03)), # more than ~30dB under the loud parts
+        'low_band_ratio': float(np.sum(power[(freqs > 0) & (freqs < 90)]) / total_power),
+        'voice_band_ratio': float(np.sum(power[(freqs >= 90) & (freqs <= 4000)]) / total_power),
+        'spectral_stability': float(np.median(similarities)) if len(similarities) else 1.0
+    }
 
-        # Convert to numpy array
-        samples = np.array(audio_segment.get_array_of_samples())
-        
-        # Convert to float32 and normalize
-        if audio_segment.sample_width > 1:
-            samples = samples.astype(np.float32) / (2**(8 * audio_segment.sample_width - 1))
-        else:
-            samples = samples.astype(np.float32) / 255.0
-        
-        # Handle stereo
-        if audio_segment.channels == 2:
-            samples = samples.reshape((-1, 2))
-        
-        # Convert to torch tensor
-        audio = torch.from_numpy(samples)
-        if audio.dim() == 1:
-            audio = audio.unsqueeze(0)  # Add channel dimension
-        elif audio.dim() == 2 and audio.shape[1] == 2:
-            audio = audio.t()  # Convert to [channels, samples] format
-        
-        sample_rate = audio_segment.frame_rate
+def prescreen_audio_for_vocals(audio, sample_rate, device=None, excerpt_count=3, excerpt_seconds=10, margin=1.5, config=None):
+    """
+    Fast tiered check for vocals, used before running the full separation.
 
-    audio = audio.to(device)
-    
-    # Separate using Open-Unmix
-    separated = separate(
-        audio,
-        rate=sample_rate,
-        model_str_or_path="umxl",
-        targets=["vocals"],
-        residual=True,
-        device=device
-    )
-    
-    # Get vocals and accompaniment
-    vocals = separated["vocals"].cpu().numpy()
-    accompaniment = separated["residual"].cpu().numpy()
+    Tier 1 looks at cheap spectral statistics, and classifies files that are plainly silent,
+    plainly voice-only (speech/TTS with pauses, no bass, energy in the voice band, and a sound that keeps
+    changing like speech does, unlike the held notes of a solo instrument) or plainly instrumental
+    (no pauses, a lot of bass, and only held notes) in well under a second.
+    Tier 2 separates only a few short excerpts spread over the audio and uses the same energy rules
+    as the full analysis, but only trusts the result when it's clearly (by margin) away from the thresholds.
+
+    Returns (has_vocals, is_vocals_only), or None if the result is unclear and the full separation is needed.
+    """
+    # Tier 1: spectral statistics
+    stats = get_vocal_presence_statistics(audio, sample_rate)
+    if stats is None:
+        return None
+    if stats['mean_amplitude'] <= 0.001:
+        print("-Vocal pre-screen: audio is (nearly) silent, no vocals")
+        return False, False
+    if stats['pause_ratio'] >= 0.2 and stats['low_band_ratio'] < 0.02 and stats['voice_band_ratio'] > 0.8 and stats['spectral_stability'] < 0.9:
+        print("-Vocal pre-screen: audio looks like plain speech/voice only")
+        return True, True
+    # no pauses, lots of bass and held notes all the way through (a voice on top keeps moving and lowers the stability)
+    if stats['pause_ratio'] < 0.02 and stats['low_band_ratio'] > 0.15 and stats['spectral_stability'] > 0.98:
+        print("-Vocal pre-screen: audio looks like plain instrumental music, no vocals")
+        return False, False
+
+    # Tier 2: separate a few short excerpts (only worth it if they're much shorter than the audio)
+    excerpt_length = int(excerpt_seconds * sample_rate)
+    audio_length = audio.shape[-1]
+    if audio_length < excerpt_length * excerpt_count * 2:
+        return None
+    starts = np.linspace(0, audio_length - excerpt_length, excerpt_count + 2).astype(int)[1:-1] # skip the intro/outro
+    vocal_energy = 0.0
+    accompaniment_energy = 0.0
+    for start in starts:
+        # (not through separate_vocals, the excerpts aren't needed again so they'd only fill up the vocals cache)
+        separated = _run_separation(audio[..., start:start + excerpt_length], sample_rate, device, config)
+        vocal_energy += torch.mean(torch.abs(separated['vocals'])).item() / excerpt_count
+        accompaniment_energy += torch.mean(torch.abs(separated['residual'])).item() / excerpt_count
+        del separated
+
+    # Same thresholds as analyze_audio_for_vocals, only accepted when clearly on one side
+    if vocal_energy > 0.001 * margin:
+        has_vocals = True
+    elif vocal_energy < 0.001 / margin:
+        has_vocals = False
+    else:
+        return None
+    if vocal_energy > accompaniment_energy * 2 * margin:
+        is_vocals_only = True
+    elif vocal_energy < accompaniment_energy * 2 / margin:
+        is_vocals_only = False
+    else:
+        return None
+    print(f"-Vocal pre-screen: decided from {excerpt_count} excerpts of {excerpt_seconds} seconds")
+    return has_vocals, is_vocals_only
+
+def analyze_audio_for_vocals(audio_path, return_separation=False, prescreen=True, config=None, separated=None):
+    """
+    Check if audio has voice in it, and also if it's a vocals-only file.
+
+    If prescreen is True, a fast check (see prescreen_audio_for_vocals) is tried first and the
+    full separation is only run when that result is unclear.
+    If separated is given (this file's separation, like from separate_vocals_batch()), it's used directly.
+    Returns (has_vocals, is_vocals_only). If return_separation is True, the separation result
+    is returned too as a third item (None if the pre-screen decided), so it can be handed to
+    extract_vocals() instead of separating twice.
+    """
+    if separated is None:
+        device = get_separation_device()
+
+        audio, sample_rate = load_audio_for_separation(audio_path)
+
+        if prescreen:
+            prescreen_result = prescreen_audio_for_vocals(audio, sample_rate, device, config=config)
+            if prescreen_result is not None:
+                has_vocals, is_vocals_only = prescreen_result
+                if return_separation:
+                    return has_vocals, is_vocals_only, None
+                return has_vocals, is_vocals_only
+            print("-Vocal pre-screen was unclear, running full separation for the analysis...")
+
+        separated = separate_vocals(audio, sample_rate, device, config)
+        del audio
     
-    # Calculate energies
-    vocal_energy = np.mean(np.abs(vocals))
-    accompaniment_energy = np.mean(np.abs(accompaniment))
+    # Get the energies (calculated while separating)
+    vocal_energy = separated['vocal_energy']
+    accompaniment_energy = separated['accompaniment_energy']
     
     # Determine if the audio has vocals and if it's vocals-only
     has_vocals = vocal_energy > 0.001  # Threshold for detecting presence of vocals
     is_vocals_only = vocal_energy > (accompaniment_energy * 2)  # If vocals are twice as prominent as accompaniment
     
+    if return_separation:
+        return has_vocals, is_vocals_only, separated
     return has_vocals, is_vocals_only
 
 def detect_audio_format(audio_path):
-    #get audio file format (like "mp3", "wav"...)
-    try:
-        audio = AudioSegment.from_file(audio_path)
-        return audio.format_info
-    except:
-        # If pydub fails, fallback to checking file extension
-        return os.path.splitext(audio_path)[1][1:].lower()
+    #get audio file format (like "mp3", "wav"...) of an audio file path or DecodedAudio, from the file headers
+    info = get_decoded_audio(audio_path).info
+    if info['format'] == 'wav' and info['codec'] and not info['codec'].startswith(('pcm_s', 'pcm_u', 'pcm_f')):
+        return info['codec'] # compressed audio in a wav file, it still needs converting to a normal wav
+    return info['format']
 
 def convert_audio_to_wav(audio_path, output_wav_path):
     # --Simple fast audio convert to wav format for main script
@@ -542,22 +1565,240 @@ def convert_audio_to_wav(audio_path, output_wav_path):
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # Load the audio file
-    audio = AudioSegment.from_file(audio_path)
-    
-    # Set the frame rate to 44100Hz (and sample width to 16-bit) if needed
-    if audio.frame_rate != 44100:
-        #print(f"Sample rate is {audio.frame_rate}, resampling to 44100Hz 16-bit")
-        audio = audio.set_frame_rate(44100).set_sample_width(2)
-    # else:
-    #     print(f"Sample rate is already 44100Hz, so no need to resample")
+    decoded_audio = get_decoded_audio(audio_path)
+    if decoded_audio.is_decoded:
+        # Already decoded, with the frame rate set to 44100Hz (and sample width to 16-bit) if needed
+        audio = decoded_audio.segment_44100()
 
-    # Export the audio to a WAV file, explicitly setting the frame rate
-    audio.export(output_wav_path, format="wav")
+        # Export the audio to a WAV file, explicitly setting the frame rate
+        audio.export(output_wav_path, format="wav")
+    else:
+        # Stream it from ffmpeg into the WAV file, so the whole audio is never in memory
+        for _ in stream_audio_with_ffmpeg(decoded_audio, wav_output_path=output_wav_path):
+            pass
 
     # Print confirmation message
     print(f"-Audio converted to wav format. Saved at: {output_wav_path}")
 
+def stream_audio_with_ffmpeg(audio_path, chunk_seconds=30, wav_output_path=""):
+    """
+    Decode an audio file (path or DecodedAudio) with ffmpeg, yielding the audio in chunks of chunk_seconds
+    as 16-bit 44100Hz PCM arrays ([samples] for mono, [samples, channels] otherwise, like wavfile.read gives).
+    Only one chunk is in memory at a time, so this works for inputs of any size.
+    If wav_output_path is given, the audio is saved there as a wav at the same time.
+    """
+    decoded_audio = get_decoded_audio(audio_path)
+    channels = decoded_audio.channels
+    command = [AudioSegment.converter, '-v', 'error', '-i', decoded_audio.path, '-vn',
+               '-f', 's16le', '-acodec', 'pcm_s16le', '-ar', '44100', '-ac', str(channels), '-']
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    wav_writer = None
+    completed = False
+    try:
+        if wav_output_path:
+            wav_writer = wave.open(wav_output_path, 'wb')
+            wav_writer.setnchannels(channels)
+            wav_writer.setsampwidth(2)
+            wav_writer.setframerate(44100)
+        chunk_bytes = int(chunk_seconds * 44100) * channels * 2
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            if wav_writer is not None:
+                wav_writer.writeframes(data)
+            samples = np.frombuffer(data, dtype='<i2')
+            yield samples.reshape(-1, channels) if channels > 1 else samples
+        process.wait()
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg could not decode {decoded_audio.path}: {process.stderr.read().decode('utf-8', errors='ignore').strip()}")
+        completed = True
+    finally:
+        if process.poll() is None:
+            process.kill() # stopped reading early
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+        if wav_writer is not None:
+            wav_writer.close()
+            if not completed and os.path.exists(wav_output_path):
+                os.remove(wav_output_path) # don't leave a cut off wav that would be reused later
+
+def read_audio_chunks(audio_path, chunk_seconds=30, wav_output_path=""):
+    """
+    Read an audio file (path or DecodedAudio) in chunks, without having all of it in memory at once.
+    Returns (sample_rate, chunks), chunks yields arrays like wavfile.read gives ([samples] or [samples, channels]).
+
+    WAV files are read memory-mapped. Other formats are taken from the DecodedAudio if it's already decoded,
+    or streamed from ffmpeg (see stream_audio_with_ffmpeg), both as the 44100Hz audio convert_audio_to_wav makes.
+    If wav_output_path is given, a non-wav input is saved there as a wav at the same time.
+    """
+    decoded_audio = get_decoded_audio(audio_path)
+    if isinstance(decoded_audio, InMemoryAudio):
+        # only in memory (or a split part, read from the audio it was split from)
+        sample_rate, audio = decoded_audio.sample_rate, decoded_audio.samples()
+    elif detect_audio_format(decoded_audio) == "wav":
+        # Use memory-mapped file reading
+        sample_rate, audio = wavfile.read(decoded_audio.path, mmap=True)
+    elif decoded_audio.is_decoded:
+        segment = decoded_audio.segment_44100()
+        if wav_output_path:
+            segment.export(wav_output_path, format="wav")
+        audio = np.array(segment.get_array_of_samples())
+        if segment.channels > 1:
+            audio = audio.reshape((-1, segment.channels))
+        sample_rate = segment.frame_rate
+    else:
+        return 44100, stream_audio_with_ffmpeg(decoded_audio, chunk_seconds, wav_output_path)
+    chunk_length = max(int(chunk_seconds * sample_rate), 1)
+    return sample_rate, (audio[start:start + chunk_length] for start in range(0, len(audio), chunk_length))
+
+def mix_to_mono(chunk, dtype=None):
+    # np.mean(chunk, axis=1, dtype=dtype) of a [samples, channels] chunk, but adding up the channel columns
+    # is a lot faster than a mean of each tiny row (and numpy adds up fewer than 8 values one by one too, so it's the same)
+    channels = chunk.shape[1]
+    if channels >= 8 or chunk.dtype == np.float16:
+        return np.mean(chunk, axis=1, dtype=dtype)
+    if dtype is None:
+        dtype = chunk.dtype if np.issubdtype(chunk.dtype, np.floating) else np.float64 # like np.mean
+    mono = chunk[:, 0].astype(dtype)
+    for channel in range(1, channels):
+        np.add(mono, chunk[:, channel], out=mono, dtype=dtype) # (added in dtype, like the mean does)
+    mono /= channels
+    return mono
+
+def float32_spectrogram(frames, sample_rate):
+    """
+    The spectrogram of each analysis window of frames ([frames, window_size]) like scipy's spectrogram gives it
+    (spectrogram(frames, fs=sample_rate, nperseg=window_size, noverlap=0) for each row), worked out in float32
+    with the same detrending, tukey window and density scaling, about twice as fast as scipy's float64 one.
+    Returns (f, Sxx) like spectrogram does, Sxx is a [bins, frames] view of a [frames, bins] array.
+    """
+    window_size = frames.shape[1]
+    window = get_window(('tukey', .25), window_size)
+    scale = np.float32(1.0 / (sample_rate * (window * window).sum()))
+    frames = np.asarray(frames, dtype=np.float32)
+    frames = frames - frames.mean(axis=1, keepdims=True) # detrend='constant'
+    frames *= window.astype(np.float32)
+    spectrum = rfft(frames, axis=1)
+    del frames
+    Sxx = spectrum.real ** 2 + spectrum.imag ** 2
+    del spectrum
+    Sxx *= scale
+    # one-sided, so every bin but 0Hz (and the Nyquist frequency for an even window size) counts twice
+    Sxx[:, 1:(window_size + 1) // 2] *= 2
+    return rfftfreq(window_size, 1 / sample_rate), Sxx.T
+
+def frame_window_starts(frame_indices, sample_rate, frame_rate, window_size):
+    """
+    The first sample of the analysis window of each VMD frame in frame_indices (an array).
+    Frame k is the audio from sample k * sample_rate // frame_rate to where the next frame starts, so the frames
+    never drift from the VMD timeline, even when a frame isn't a whole number of samples long.
+    The window is centered on its frame's samples (it's exactly the frame when window_size is the frame's length).
+    """
+    frame_starts = frame_indices * sample_rate // frame_rate
+    frame_lengths = (frame_indices + 1) * sample_rate // frame_rate - frame_starts
+    return frame_starts + (frame_lengths - window_size) // 2
+
+def frame_audio_range(first_frame, last_frame, sample_rate, frame_rate, window_size, audio_length):
+    """
+    The samples (start, end) of the audio that the VMD frames from first_frame to last_frame (not included) are
+    made from: their own samples and their analysis windows (see frame_window_starts), within the audio.
+    """
+    window_starts = frame_window_starts(np.array([first_frame, last_frame - 1]), sample_rate, frame_rate, window_size)
+    start = min(first_frame * sample_rate // frame_rate, int(window_starts[0]))
+    end = max(last_frame * sample_rate // frame_rate, int(window_starts[1]) + window_size)
+    return max(start, 0), min(end, audio_length)
+
+def stream_spectrogram(chunks, sample_rate, frame_rate=30, window_size=0, use_float32=False, first_frame=0, last_frame=None, chunks_start=0):
+    """
+    Spectrogram of the mono mix of audio given in chunks (see read_audio_chunks), one column for each
+    VMD frame (at frame_rate frames per second), one block of frames per chunk.
+    Yields (f, Sxx) for each block. Each frame's analysis window is window_size samples long (0 = one frame long)
+    and centered on the frame (see frame_window_starts), the audio before the start and past the end counts as silence.
+    With the default one frame long windows and a sample rate that divides evenly by frame_rate, together the blocks are
+    the same as spectrogram(audio, fs=sample_rate, nperseg=window_size, noverlap=0) on the whole mixed audio.
+    Only one chunk of audio (and its spectrogram) is in memory at a time.
+    With use_float32 the audio is mixed and analyzed in float32 (see float32_spectrogram).
+
+    Only the frames from first_frame to last_frame (None = to the end) can be analyzed, then the chunks only need to
+    have the audio those frames need (see frame_audio_range), starting at sample chunks_start of the whole audio.
+    Each frame is exactly the same as when the whole audio is analyzed, so the ranges can be analyzed separately
+    and put back together (see analyze_audio_in_parallel).
+    """
+    if not window_size:
+        window_size = sample_rate // frame_rate
+    analyzed_frames = first_frame
+    buffer = None # the audio not analyzed yet (and the silence before the start)
+    buffer_start = min(int(frame_window_starts(np.array([first_frame]), sample_rate, frame_rate, window_size)[0]), chunks_start)
+    buffer_end = chunks_start # (in samples of the whole audio)
+
+    def frames_spectrogram(frame_end):
+        # the spectrogram of the frames from analyzed_frames to frame_end, their windows are in the buffer
+        window_starts = frame_window_starts(np.arange(analyzed_frames, frame_end), sample_rate, frame_rate, window_size) - buffer_start
+        if window_size * frame_rate == sample_rate:
+            # the windows are the frames themselves, one after another
+            frames = buffer[window_starts[0]:window_starts[-1] + window_size]
+            if use_float32:
+                return float32_spectrogram(frames.reshape(-1, window_size), sample_rate)
+            f, _, Sxx = spectrogram(frames, fs=sample_rate, nperseg=window_size, noverlap=0)
+            return f, Sxx
+        frames = np.lib.stride_tricks.sliding_window_view(buffer, window_size)[window_starts] # (copies only these windows)
+        if use_float32:
+            return float32_spectrogram(frames, sample_rate)
+        f, _, Sxx = spectrogram(frames, fs=sample_rate, nperseg=window_size, noverlap=0, axis=-1)
+        return f, Sxx[..., 0].T
+
+    for chunk in chunks:
+        if use_float32:
+            chunk = mix_to_mono(chunk, np.float32) if len(chunk.shape) > 1 else np.asarray(chunk, dtype=np.float32)
+        else:
+            chunk = mix_to_mono(chunk) if len(chunk.shape) > 1 else np.asarray(chunk)
+        if buffer is None:
+            buffer = np.concatenate([np.zeros(-buffer_start, dtype=chunk.dtype), chunk]) if buffer_start < 0 else chunk
+        else:
+            buffer = np.concatenate([buffer, chunk]) if len(buffer) else chunk
+        buffer_end += len(chunk)
+
+        # the whole frames read so far, that have all of their window read too
+        frame_end = buffer_end * frame_rate // sample_rate
+        if last_frame is not None:
+            frame_end = min(frame_end, last_frame)
+        candidates = np.arange(analyzed_frames, frame_end)
+        window_ends = frame_window_starts(candidates, sample_rate, frame_rate, window_size) + window_size
+        frame_end = analyzed_frames + int(np.searchsorted(window_ends, buffer_end, side='right'))
+        if frame_end > analyzed_frames:
+            yield frames_spectrogram(frame_end)
+            analyzed_frames = frame_end
+            # only keep the audio the next windows need
+            next_start = min(int(frame_window_starts(np.array([analyzed_frames]), sample_rate, frame_rate, window_size)[0]), buffer_end)
+            if next_start > buffer_start:
+                buffer = buffer[next_start - buffer_start:]
+                buffer_start = next_start
+
+    # (the chunks were all the audio the frames up to last_frame need)
+    frame_end = buffer_end * frame_rate // sample_rate if last_frame is None else last_frame
+    if frame_end > analyzed_frames:
+        # the last frames, their windows go past the end of the audio
+        last_window_end = int(frame_window_starts(np.array([frame_end - 1]), sample_rate, frame_rate, window_size)[0]) + window_size
+        buffer = np.concatenate([buffer, np.zeros(max(last_window_end - buffer_end, 0), dtype=buffer.dtype)])
+        yield frames_spectrogram(frame_end)
+    elif not analyzed_frames:
+        # shorter than one frame, let spectrogram handle it like it did for the whole audio
+        audio = buffer[-buffer_start:] if buffer is not None else np.zeros(0)
+        f, _, Sxx = spectrogram(audio, fs=sample_rate, nperseg=window_size, noverlap=0)
+        yield f, Sxx
+
+def chunked_spectrogram(chunks, sample_rate, frame_rate=30, window_size=0):
+    """
+    The whole spectrogram of audio given in chunks, one column for each VMD frame (see stream_spectrogram).
+    Returns (f, Sxx).
+    """
+    Sxx_parts = []
+    for f, chunk_Sxx in stream_spectrogram(chunks, sample_rate, frame_rate, window_size):
+        Sxx_parts.append(chunk_Sxx)
+    return f, (np.concatenate(Sxx_parts, axis=1) if len(Sxx_parts) > 1 else Sxx_parts[0])
+
 def process_audio_frames(f, Sxx, batch_size=1000):
     """Generator function to process audio frames in batches"""
     for batch_start in range(0, Sxx.shape[1], batch_size):
@@ -565,8 +1806,270 @@ def process_audio_frames(f, Sxx, batch_size=1000):
         batch_Sxx = Sxx[:, batch_start:batch_end]
         yield batch_start, batch_end, batch_Sxx, f
 
-def audio_to_vmd(input_audio, vmd_file, model_name, config):
-    """Convert any audio file to VMD file"""
+# Vowel frequency ranges, in the order their morphs are added to the VMD
+VOWEL_RANGES = {
+    'あ': (800, 1200),
+    'い': (2300, 2700),
+    'う': (300, 700),
+    'お': (500, 900)
+}
+
+def smooth_vowel_weights(weights, window=5, method='mean'):
+    """
+    Smooth a [frames, vowels] array of vowel weights over time, each frame only from itself and the frames before it.
+
+    method:
+    'mean': the mean of the last window frames (fewer at the start), the same as averaging them frame by frame
+    'ema': exponential moving average with the smoothing of a window frames long mean (alpha = 2 / (window + 1))
+    'median': the median of the last window frames (fewer at the start), keeps sharp mouth changes sharp
+    'none': no smoothing (same as a window of 1)
+    """
+    frame_count = len(weights)
+    if method == 'none' or window <= 1 or frame_count == 0:
+        return weights.copy()
+
+    if method == 'mean':
+        smoothed_weights = np.zeros_like(weights)
+        for offset in range(min(window, frame_count) - 1, -1, -1): # oldest frame first
+            smoothed_weights[offset:] += weights[:frame_count - offset]
+        smoothed_weights /= np.minimum(np.arange(1, frame_count + 1), window).astype(weights.dtype)[:, None]
+        return smoothed_weights
+    elif method == 'ema':
+        alpha = 2 / (window + 1)
+        # starts from the first frame, like a mean of just that frame
+        smoothed_weights = lfilter([alpha], [1, alpha - 1], weights, axis=0, zi=(1 - alpha) * weights[:1])[0]
+        return smoothed_weights.astype(weights.dtype)
+    elif method == 'median':
+        smoothed_weights = np.empty_like(weights)
+        for frame in range(min(window - 1, frame_count)):
+            smoothed_weights[frame] = np.median(weights[:frame + 1], axis=0)
+        if frame_count >= window:
+            windows = np.lib.stride_tricks.sliding_window_view(weights, window, axis=0) # [frames, vowels, window], not a copy
+            # in blocks, the median sorts a copy of the windows it's given
+            block_frames = max(1048576 // window, 1)
+            for block_start in range(0, len(windows), block_frames):
+                block_end = block_start + block_frames
+                smoothed_weights[window - 1 + block_start:window - 1 + block_end] = np.median(windows[block_start:block_end], axis=-1)
+        return smoothed_weights
+    raise ValueError(f"Invalid smoothing_method option: {method}")
+
+def vowel_filterbank(f):
+    """
+    The vowel ranges as a filterbank over the spectrogram bins f: each column of the matrix averages the bins of one vowel range.
+    Only the bins from first_bin to last_bin have a vowel range, so the matrix is only for those.
+    Returns (first_bin, last_bin, filterbank [bins, vowels] in VOWEL_RANGES order).
+    """
+    band_indices = [(np.argmin(np.abs(f - low)), np.argmin(np.abs(f - high))) for low, high in VOWEL_RANGES.values()]
+    first_bin = min(low_index for low_index, _ in band_indices)
+    last_bin = max(high_index for _, high_index in band_indices)
+    filterbank = np.zeros((last_bin - first_bin, len(VOWEL_RANGES)), dtype=np.float32)
+    for vowel_index, (low_index, high_index) in enumerate(band_indices):
+        # (an empty range gives NaN, like the mean of no bins)
+        filterbank[low_index - first_bin:high_index - first_bin, vowel_index] = 1 / (high_index - low_index) if high_index > low_index else np.nan
+    return first_bin, last_bin, filterbank
+
+def analyze_vowel_frames(spectrogram_blocks, batch_size=1000, use_filterbank=False):
+    """
+    Reduce a spectrogram given in blocks of frames ((f, Sxx) pairs, like stream_spectrogram yields) to
+    what the vowel weights are made from: the mean of each vowel range and the total energy of every frame,
+    and the max of the whole spectrogram. Only one block of the spectrogram is needed at a time.
+    With use_filterbank the vowel range means are one matrix product with vowel_filterbank (in float32)
+    instead of a mean of each range, close to the same but not rounded exactly the same.
+    Returns (band_means [frames, vowels] in VOWEL_RANGES order, energy [frames], max_Sxx).
+    """
+    band_indices = None
+    max_Sxx = None
+    band_means_parts = []
+    energy_parts = []
+    for f, Sxx in spectrogram_blocks:
+        if band_indices is None:
+            # Frequency bins of each vowel range (computed once)
+            band_indices = [(np.argmin(np.abs(f - low)), np.argmin(np.abs(f - high))) for low, high in VOWEL_RANGES.values()]
+            first_bin, last_bin, filterbank = vowel_filterbank(f)
+        block_max = np.max(Sxx)
+        max_Sxx = block_max if max_Sxx is None else np.maximum(max_Sxx, block_max) # running max of all the blocks
+
+        band_means = np.empty((Sxx.shape[1], len(VOWEL_RANGES)), dtype=Sxx.dtype)
+        energy = np.empty(Sxx.shape[1], dtype=Sxx.dtype)
+        for batch_start, batch_end, batch_Sxx, f in process_audio_frames(f, Sxx, batch_size):
+            # frames as rows, so each frame's bins are summed in the same order as its own column would be
+            frames_Sxx = np.ascontiguousarray(batch_Sxx.T)
+            energy[batch_start:batch_end] = frames_Sxx.sum(axis=1)
+            if use_filterbank:
+                band_means[batch_start:batch_end] = frames_Sxx[:, first_bin:last_bin] @ filterbank
+            else:
+                for vowel_index, (low_index, high_index) in enumerate(band_indices):
+                    band_means[batch_start:batch_end, vowel_index] = frames_Sxx[:, low_index:high_index].mean(axis=1)
+            del frames_Sxx
+        band_means_parts.append(band_means)
+        energy_parts.append(energy)
+        del Sxx # done with this block
+
+    return np.concatenate(band_means_parts), np.concatenate(energy_parts), max_Sxx
+
+def stream_block_ends(audio_length, sample_rate, frame_rate=30, window_size=0, chunk_seconds=30):
+    """
+    The frame each block of stream_spectrogram ends at, for audio_length samples read in chunk_seconds long
+    chunks (like read_audio_chunks). These are the frames a long file can be split at for analyze_audio_in_parallel.
+    """
+    if not window_size:
+        window_size = sample_rate // frame_rate
+    chunk_length = max(int(chunk_seconds * sample_rate), 1)
+    chunk_ends = np.append(np.arange(chunk_length, audio_length, chunk_length), audio_length)
+    frame_count = audio_length * frame_rate // sample_rate
+    window_ends = frame_window_starts(np.arange(frame_count), sample_rate, frame_rate, window_size) + window_size
+    # the whole frames read at the end of each chunk, that have all of their window read too
+    block_ends = np.minimum(chunk_ends * frame_rate // sample_rate, np.searchsorted(window_ends, chunk_ends, side='right'))
+    block_ends[-1] = frame_count # (the last ones are padded with silence)
+    return block_ends
+
+def _worker_chunks_range(first_frame, last_frame, sample_rate, frame_rate, window_size, audio_length, chunk_seconds=30):
+    # The samples (start, end) of the chunks read_audio_chunks gives that the frames from first_frame to last_frame need
+    start, end = frame_audio_range(first_frame, last_frame, sample_rate, frame_rate, window_size, audio_length)
+    chunk_length = max(int(chunk_seconds * sample_rate), 1)
+    chunks_start = start // chunk_length * chunk_length
+    return chunks_start, min(chunks_start + -(-(end - chunks_start) // chunk_length) * chunk_length, audio_length)
+
+def _analyze_frames_in_worker(audio, first_frame, last_frame, frame_rate, window_size, use_float32, sample_rate=None, audio_length=None, audio_start=0, chunk_seconds=30):
+    # Runs in a worker process of analyze_audio_in_parallel: analyze_vowel_frames for the frames from first_frame to last_frame.
+    # audio is a wav file path, or the samples of the audio (audio_length samples at sample_rate) from sample audio_start on
+    if isinstance(audio, str):
+        sample_rate, audio = wavfile.read(audio, mmap=True)
+        audio_length = len(audio)
+    if not window_size:
+        window_size = sample_rate // frame_rate
+    chunks_start, chunks_end = _worker_chunks_range(first_frame, last_frame, sample_rate, frame_rate, window_size, audio_length, chunk_seconds)
+    # the same chunks read_audio_chunks gives, so the blocks (and the rounding of their matrix products) are the same too
+    chunk_length = max(int(chunk_seconds * sample_rate), 1)
+    chunks = (audio[chunk_start - audio_start:chunk_start - audio_start + chunk_length] for chunk_start in range(chunks_start, chunks_end, chunk_length))
+    return analyze_vowel_frames(stream_spectrogram(chunks, sample_rate, frame_rate, window_size, use_float32, first_frame, last_frame, chunks_start),
+                                use_filterbank=use_float32)
+
+def analyze_audio_in_parallel(audio_path, frame_rate=30, window_size=0, use_float32=False, workers=1, min_seconds_per_worker=60):
+    """
+    analyze_vowel_frames of a whole wav file or in-memory audio (like a split part or separated vocals kept in memory,
+    see InMemoryAudio) like audio_to_vmd does, with its frames split into time ranges that are analyzed by a pool of
+    worker processes at the same time.
+    The ranges are split where the blocks of one serial stream_spectrogram end (stream_block_ends) and each worker
+    gets the audio its analysis windows need around its range (it reads it from the wav file itself, in-memory audio
+    is sent to it), so every frame is made exactly like in a serial run and the ranges are just put back together
+    in order (the max is the max of their maxes).
+    The smoothing is done after that on the whole file, so the result is identical to a serial run.
+    Audio shorter than min_seconds_per_worker for each worker uses fewer workers (and no pool for a single one).
+    Returns (band_means, energy, max_Sxx) like analyze_vowel_frames.
+    """
+    decoded_audio = get_decoded_audio(audio_path)
+    if isinstance(decoded_audio, InMemoryAudio):
+        sample_rate, samples = decoded_audio.sample_rate, decoded_audio.samples()
+        audio_length = len(samples)
+    else:
+        sample_rate, samples = wavfile.read(decoded_audio.path, mmap=True)
+        audio_length = len(samples)
+        samples = None # each worker reads its part of the file
+    frame_count = audio_length * frame_rate // sample_rate
+    workers = max(min(workers, int(frame_count / (min_seconds_per_worker * frame_rate))), 1)
+    block_ends = stream_block_ends(audio_length, sample_rate, frame_rate, window_size)
+    # the block end closest to an even split for each worker
+    split_frames = sorted({0, frame_count} | {int(block_ends[np.argmin(np.abs(block_ends - frame_count * worker // workers))]) for worker in range(1, workers)})
+    frame_ranges = [(first_frame, last_frame) for first_frame, last_frame in zip(split_frames, split_frames[1:]) if last_frame > first_frame]
+    if len(frame_ranges) <= 1:
+        sample_rate, audio_chunks = read_audio_chunks(decoded_audio)
+        return analyze_vowel_frames(stream_spectrogram(audio_chunks, sample_rate, frame_rate, window_size, use_float32), use_filterbank=use_float32)
+
+    worker_args = []
+    for first_frame, last_frame in frame_ranges:
+        if samples is None:
+            worker_args.append((decoded_audio.path, first_frame, last_frame, frame_rate, window_size, use_float32))
+        else:
+            # only the samples the worker needs are sent to it
+            chunks_start, chunks_end = _worker_chunks_range(first_frame, last_frame, sample_rate, frame_rate, window_size or sample_rate // frame_rate, audio_length)
+            worker_args.append((samples[chunks_start:chunks_end], first_frame, last_frame, frame_rate, window_size, use_float32, sample_rate, audio_length, chunks_start))
+    print(f"Analyzing the audio with {len(frame_ranges)} workers")
+    with ProcessPoolExecutor(max_workers=len(frame_ranges)) as executor:
+        results = [future.result() for future in [executor.submit(_analyze_frames_in_worker, *args) for args in worker_args]]
+    del worker_args, samples
+    band_means = np.concatenate([result[0] for result in results])
+    energy = np.concatenate([result[1] for result in results])
+    max_Sxx = results[0][2]
+    for result in results[1:]:
+        max_Sxx = np.maximum(max_Sxx, result[2])
+    return band_means, energy, max_Sxx
+
+def compute_vowel_weights(f, Sxx, config, batch_size=1000):
+    """
+    Compute the vowel morph weights of every frame (column) of the spectrogram Sxx with whole-array operations.
+    Returns a [frames, vowels] array of the weights in VOWEL_RANGES order (0 for frames without speech).
+    (see analyze_vowel_frames and vowel_weights_from_features for a spectrogram that's made block by block)
+
+    The result is exactly what working frame by frame gives: the band means, normalization, smoothing
+    (see smooth_vowel_weights, set with smoothing_window and smoothing_method), energy gating and vowel
+    multipliers are all added up in the same order and with the same precision as for a single frame.
+    """
+    band_means, energy, max_Sxx = analyze_vowel_frames([(f, Sxx)], batch_size)
+    return vowel_weights_from_features(band_means, energy, max_Sxx, config)
+
+def normalize_vowel_weights(band_means):
+    # The vowel range means of each frame as weights that add up to 1, in place (frames with no weight at all are left as they are)
+    total_weight = band_means[:, 0].copy()
+    for vowel_index in range(1, len(VOWEL_RANGES)):
+        total_weight += band_means[:, vowel_index]
+    has_weight = total_weight > 0
+    band_means[has_weight] /= total_weight[has_weight, None]
+    return band_means
+
+def smoothing_window_frames(config, frame_rate=30):
+    # smoothing_window is in frames at 30 per second, so it's scaled to frame_rate
+    return max(int(round(config.get('smoothing_window', 5) * frame_rate / 30)), 1)
+
+def scale_vowel_weights(smoothed_weights, energy, max_Sxx, config):
+    # The smoothed weights adjusted with the config and scaled by each frame's energy (0 for frames without speech)
+    adjusted_weights = adjust_vowel_weights_array(smoothed_weights, config)
+    energy_ratios = np.clip(energy / max_Sxx, 0, 1)
+    if config.get('fast_band_energies', True):
+        energy_scale = np.sqrt(energy_ratios).astype(smoothed_weights.dtype)
+    else:
+        # (one frame at a time, exactly like before: an array's ** 0.5 is a square root, which can round the last bit differently)
+        energy_scale = np.array([energy_ratio ** 0.5 for energy_ratio in energy_ratios], dtype=smoothed_weights.dtype)
+    vowel_weights = np.minimum(adjusted_weights * energy_scale[:, None], 1.0)
+
+    is_speech = energy > 0.01 * max_Sxx
+    vowel_weights[~is_speech] = 0
+    return vowel_weights
+
+def vowel_weights_from_features(band_means, energy, max_Sxx, config, frame_rate=30):
+    """
+    The vowel morph weights of every frame from what analyze_vowel_frames gives (see compute_vowel_weights).
+    band_means is normalized in place. smoothing_window is in frames at 30 per second, so it's scaled to frame_rate.
+    """
+    # (the frames without speech are computed too and then set to 0, so their divisions by 0 don't matter)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = normalize_vowel_weights(band_means)
+        smoothed_weights = smooth_vowel_weights(weights, smoothing_window_frames(config, frame_rate), config.get('smoothing_method', 'mean'))
+        del weights
+        return scale_vowel_weights(smoothed_weights, energy, max_Sxx, config)
+
+def vmd_timeline_weights(vowel_weights, frame_rate=30):
+    """
+    The vowel weights of each keyframe on MMD's 30 fps timeline, from weights analyzed at frame_rate.
+    At 60 fps each VMD frame k is the average of half frames 2k and 2k+1, which cover exactly the samples
+    frame k would at 30 fps. A last half frame without its pair is left out (as it would be at 30 fps).
+    """
+    if frame_rate == 30:
+        return vowel_weights
+    pair_count = len(vowel_weights) // 2
+    return (vowel_weights[0:pair_count * 2:2] + vowel_weights[1:pair_count * 2:2]) * np.float32(0.5)
+
+def audio_to_vmd(input_audio, vmd_file, model_name, config, vocals_status=None):
+    """
+    Convert any audio file to VMD file
+
+    vocals_status can be given as (has_vocals, is_vocals_only) when the audio was already
+    analyzed (like in process_single_file), so it won't be analyzed again here.
+    input_audio can be a file path or a DecodedAudio (decoded at most once for all the steps here).
+    Returns the features the VMD was made from, (band_means, energy, max_Sxx) (see features_to_vmd).
+    """
+    decoded_audio = get_decoded_audio(input_audio)
+    input_audio = decoded_audio.path
     # Extract vocals and save as a temporary WAV file
     # Create the new filename by appending "_vocals_only" before the extension
     temp_base_name, ext = os.path.splitext(os.path.basename(input_audio))
@@ -574,18 +2077,22 @@ def audio_to_vmd(input_audio, vmd_file, model_name, config):
     temp_dironly_output = os.path.dirname(os.path.abspath(vmd_file))
     temp_wav = input_audio
     temp_vocals_only_file = ""
+    keep_intermediate_files = config.get('keep_intermediate_files', True)
     
     # Get the vocal separation mode from config
     separate_vocals_mode = config.get('separate_vocals', 'automatic')
     print(f"separate_vocals_mode = {separate_vocals_mode}")
     temp_base_name = os.path.splitext(os.path.basename(input_audio))[0]
-    if re.search(r'_vocals_only(_part\d+)?$', temp_base_name):
+    if vocals_status is not None:
+        # already analyzed before being given to this function
+        input_audio_has_vocals, input_audio_is_vocals_only = vocals_status
+    elif re.search(r'_vocals_only(_part\d+)?$', temp_base_name):
         # filename ends with _vocals_only or _vocals_only_partN, so already is vocals_only, skip
         input_audio_has_vocals = True
         input_audio_is_vocals_only = True
     elif separate_vocals_mode == 'automatic':
         #check if audio is already voice only
-        input_audio_has_vocals, input_audio_is_vocals_only = analyze_audio_for_vocals(os.path.abspath(input_audio))
+        input_audio_has_vocals, input_audio_is_vocals_only = analyze_audio_for_vocals(decoded_audio, prescreen=config.get('vocal_prescreen', True), config=config)
     elif separate_vocals_mode == 'always':
         input_audio_has_vocals = True
         input_audio_is_vocals_only = False
@@ -594,7 +2101,7 @@ def audio_to_vmd(input_audio, vmd_file, model_name, config):
         input_audio_is_vocals_only = True
     
     #Prints audio duration information
-    temp_duration = get_audio_duration(input_audio, True)
+    temp_duration = get_audio_duration(decoded_audio, True)
     print(f"Audio filename: {os.path.basename(input_audio)}")
     print(f"Audio duration: {temp_duration}")
     if not input_audio_has_vocals and separate_vocals_mode == 'automatic':
@@ -605,102 +2112,261 @@ def audio_to_vmd(input_audio, vmd_file, model_name, config):
         temp_wav = f"{temp_base_name}_vocals_only.wav"
         temp_wav_basename = temp_wav
         temp_wav = os.path.join(temp_dironly_output, temp_wav) # full path
-        if not os.path.exists(temp_wav):
+        if not os.path.exists(temp_wav) or config.get('vocals_cache_dir', "vocals_cache"):
+            # with the vocals cache on, always extract (a cache hit skips the separation), so a stale same-named file isn't used
             print(f"-Non-vocal elements detected along with vocals in audio file, will extract vocals to wav named: {temp_wav_basename}")
-            extract_vocals(input_audio, temp_wav) # saves as a vocals-only wav file
+            temp_wav = extract_vocals(decoded_audio, temp_wav, config=config, keep_file=keep_intermediate_files) # saves as a vocals-only wav file (or keeps it in memory)
         else:
             print(f"-Non-vocal elements detected along with vocals in audio file, will use the name-matching already existing wav file instead: {temp_wav_basename}")
         temp_vocals_only_file = temp_wav # used to tell it to use voicals-only if non-wav audio is detected
     elif input_audio_has_vocals and input_audio_is_vocals_only:
         print(f"-Audio file detected as containing only vocals, so no vocal separation needed for {os.path.basename(input_audio)}")
 
-    if detect_audio_format(os.path.abspath(input_audio)) != "wav":
+    vmd_audio = decoded_audio if temp_wav == input_audio else temp_wav # the audio the VMD is made from (a split part is read from memory)
+    converted_wav_output = "" # wav saved while reading vmd_audio
+    if detect_audio_format(decoded_audio) != "wav":
         # Audio was not given as a wav, will convert to wav format needed by wav2vmd script(this is faster than vocals extraction)
         # This will create a wav even if you already a vocals-only wav. This is so you'll have a full wav file that you can load in MMD.
+        # (unless save_converted_wav is False, then the VMD is made straight from the decoded audio stream)
+        save_converted_wav = config.get('save_converted_wav', True) and keep_intermediate_files
         temp_wav = f"{temp_base_name}.wav"
         temp_wav_basename = temp_wav
-        
+
         temp_wav = os.path.join(temp_dironly_output, temp_wav)
-        if not os.path.exists(temp_wav):
-            print(f"-Audio file not in required wav format for MMD, will convert to wav named: {temp_wav_basename}")
-            convert_audio_to_wav(input_audio, temp_wav)
-        else:
+        if os.path.exists(temp_wav):
             print(f"-Audio file not in required wav format for MMD, will use the name-matching already existing wav file instead: {temp_wav_basename}")
+            vmd_audio = temp_wav
+        elif temp_vocals_only_file:
+            if save_converted_wav:
+                print(f"-Audio file not in required wav format for MMD, will convert to wav named: {temp_wav_basename}")
+                convert_audio_to_wav(decoded_audio, temp_wav)
+        else:
+            # decode the input once, making the VMD from it and saving the wav at the same time
+            if save_converted_wav:
+                print(f"-Audio file not in required wav format for MMD, will convert to wav named: {temp_wav_basename}")
+                converted_wav_output = temp_wav
+            vmd_audio = decoded_audio
         if temp_vocals_only_file:
-            temp_wav = temp_vocals_only_file
+            vmd_audio = temp_vocals_only_file
     else:
         print(f"-Audio file already in wav format, no conversion needed.")
 
     print("Converting Audio to VMD...")
 
-    # Use memory-mapped file reading
-    sample_rate, audio = wavfile.read(temp_wav, mmap=True)
-    audio = np.mean(audio, axis=1) if len(audio.shape) > 1 else audio
-    
-    # Compute spectrogram
-    frame_rate = 30
-    window_size = int(sample_rate / frame_rate)
-    f, t, Sxx = spectrogram(audio, fs=sample_rate, nperseg=window_size, noverlap=0)
-
-    # Define vowel frequency ranges
-    vowel_ranges = {
-        'あ': (800, 1200),
-        'い': (2300, 2700),
-        'う': (300, 700),
-        'お': (500, 900)
-    }
+    # Compute spectrogram, one block at a time (only the vowel ranges' means and the energy of each frame are kept)
+    frame_rate = config.get('vmd_frame_rate', 30)
+    if frame_rate not in (30, 60):
+        raise ValueError(f"Invalid vmd_frame_rate option: {frame_rate}")
+    window_size = config.get('analysis_window_size', 0) # 0 = one frame long
+    fast_band_energies = config.get('fast_band_energies', True) # float32 spectrogram and vowel filterbank
+    analysis_workers = config.get('analysis_workers', 1)
+    if not analysis_workers:
+        analysis_workers = os.cpu_count() or 1
+    vmd_audio = get_decoded_audio(vmd_audio)
+    if analysis_workers > 1 and (isinstance(vmd_audio, InMemoryAudio) or detect_audio_format(vmd_audio) == "wav"):
+        # a wav file on disk or audio in memory (like a split part), so each worker can get its own part of it
+        # (other formats are streamed from ffmpeg in one go)
+        band_means, energy, max_Sxx = analyze_audio_in_parallel(vmd_audio, frame_rate, window_size, fast_band_energies, analysis_workers)
+    else:
+        # Read the audio in chunks (memory-mapped for wavs, streamed from ffmpeg otherwise)
+        sample_rate, audio_chunks = read_audio_chunks(vmd_audio, wav_output_path=converted_wav_output)
+        band_means, energy, max_Sxx = analyze_vowel_frames(stream_spectrogram(audio_chunks, sample_rate, frame_rate, window_size, use_float32=fast_band_energies),
+                                                           use_filterbank=fast_band_energies)
+        del audio_chunks
 
-    vmd = VMDFile(model_name)
-    smoothing_window = 5
-    vowel_weights_history = []
-    max_Sxx = np.max(Sxx)  # Calculate max once
-
-    # Process frames using generator
-    for batch_start, batch_end, batch_Sxx, f in process_audio_frames(f, Sxx):
-        for frame in range(batch_start, batch_end):
-            rel_frame = frame - batch_start
-            
-            # Calculate vowel weights exactly as before
-            vowel_weights = {v: np.mean(batch_Sxx[np.argmin(np.abs(f - low)):np.argmin(np.abs(f - high)), rel_frame])
-                           for v, (low, high) in vowel_ranges.items()}
-
-            # Normalize weights
-            total_weight = sum(vowel_weights.values())
-            if total_weight > 0:
-                vowel_weights = {v: w / total_weight for v, w in vowel_weights.items()}
-
-            # Apply smoothing
-            vowel_weights_history.append(vowel_weights)
-            if len(vowel_weights_history) > smoothing_window:
-                vowel_weights_history.pop(0)
-            smoothed_weights = {v: np.mean([w[v] for w in vowel_weights_history]) for v in vowel_weights}
-
-            energy = np.sum(batch_Sxx[:, rel_frame])
-            is_speech = energy > 0.01 * max_Sxx
-
-            # Use the config in the vowel weight adjustment
-            if is_speech:
-                energy_scale = np.clip(energy / max_Sxx, 0, 1) ** 0.5
-                adjusted_weights = adjust_vowel_weights(smoothed_weights, config)
-
-                for vowel, weight in adjusted_weights.items():
-                    scaled_weight = min(weight * energy_scale, 1.0)
-                    vmd.add_morph_frame(vowel, frame, scaled_weight)
-            else:
-                for vowel in vowel_weights:
-                    vmd.add_morph_frame(vowel, frame, 0)
+    features_to_vmd(band_means, energy, max_Sxx, vmd_file, model_name, config)
+    return band_means, energy, max_Sxx
 
-        # Clean up batch memory
-        del batch_Sxx
+def features_to_vmd(band_means, energy, max_Sxx, vmd_file, model_name, config):
+    # Make the VMD file from the features of its audio (see analyze_vowel_frames), with the weight settings of config.
+    # Returns the number of keyframes in it
+    frame_rate = config.get('vmd_frame_rate', 30)
 
-    # Clean up memory
-    del audio
-    del Sxx
-    
+    # Vowel weights of every frame, all at once (band_means is normalized in place, so it's given a copy)
+    # and then put on MMD's 30 fps timeline
+    vowel_weights = vowel_weights_from_features(band_means.copy(), energy, max_Sxx, config, frame_rate)
+    vowel_weights = vmd_timeline_weights(vowel_weights, frame_rate)
+
+    vmd = VMDFile(model_name)
     if config.get('optimize_vmd', True):
-        optimize_vmd_data(vmd)
+        # only the frames optimize_vmd_data would keep
+        vowel_indices, frames = optimized_vowel_frames(vowel_weights)
+    else:
+        vowel_indices = np.tile(np.arange(len(VOWEL_RANGES)), len(vowel_weights))
+        frames = np.repeat(np.arange(len(vowel_weights)), len(VOWEL_RANGES))
+    vmd.add_morph_frames([list(VOWEL_RANGES)[vowel_index] for vowel_index in vowel_indices.tolist()], frames.tolist(), list(vowel_weights[frames, vowel_indices]))
+    del vowel_weights
+
     vmd.save(vmd_file)
     print(f"VMD saved at: {os.path.abspath(vmd_file)}")
+    return len(vmd.morph_frames)
+
+# Raw PCM sample formats a live stream can be in (ffmpeg's names for them)
+PCM_SAMPLE_FORMATS = {
+    'u8': np.dtype('u1'),
+    's16le': np.dtype('<i2'),
+    's32le': np.dtype('<i4'),
+    'f32le': np.dtype('<f4')
+}
+
+def read_pcm_stream(read, channels=1, sample_format='s16le', read_size=65536):
+    """
+    Read raw PCM audio from a live stream (like a pipe or a socket) as it comes in, as chunks for stream_spectrogram.
+    read is called with a byte count and returns the bytes that are there (up to that many, at least one), b'' at the end.
+    Yields arrays like wavfile.read gives ([samples] or [samples, channels]) as soon as there are whole samples.
+    """
+    if sample_format not in PCM_SAMPLE_FORMATS:
+        raise ValueError(f"Invalid sample format: {sample_format}")
+    dtype = PCM_SAMPLE_FORMATS[sample_format]
+    sample_bytes = dtype.itemsize * channels
+    pending = b'' # the start of a sample that isn't all there yet
+    while True:
+        data = read(read_size)
+        if not data:
+            break
+        pending += data
+        usable = len(pending) - len(pending) % sample_bytes
+        if usable:
+            samples = np.frombuffer(pending[:usable], dtype=dtype)
+            pending = pending[usable:]
+            yield samples.reshape(-1, channels) if channels > 1 else samples
+
+def stream_lipsync(chunks, sample_rate, config):
+    """
+    The VMD analysis of audio that's still coming in (like live TTS output), given in chunks like stream_spectrogram takes them.
+    Yields (first_frame, vowel_weights [frames, vowels] in VOWEL_RANGES order) as soon as each frame's analysis window
+    has come in, so with the default one frame long windows a frame is out as soon as its last sample is read.
+
+    The weights are the same as vowel_weights_from_features gives for the whole audio, except that the energy is
+    scaled to the loudest frame so far (the loudest of the whole audio isn't known yet). The smoothing carries on
+    from the frames before, so it doesn't restart at each block.
+    """
+    frame_rate = config.get('vmd_frame_rate', 30)
+    if frame_rate not in (30, 60):
+        raise ValueError(f"Invalid vmd_frame_rate option: {frame_rate}")
+    fast_band_energies = config.get('fast_band_energies', True)
+    smoothing_window = smoothing_window_frames(config, frame_rate)
+    smoothing_method = config.get('smoothing_method', 'mean')
+
+    history = None # the weights of the frames before that the smoothing needs ('ema' only needs its last smoothed frame)
+    max_Sxx = None
+    first_frame = 0
+    for block in stream_spectrogram(chunks, sample_rate, frame_rate, config.get('analysis_window_size', 0), use_float32=fast_band_energies):
+        band_means, energy, block_max = analyze_vowel_frames([block], use_filterbank=fast_band_energies)
+        if len(energy) == 0:
+            continue
+        max_Sxx = block_max if max_Sxx is None else np.maximum(max_Sxx, block_max) # the loudest so far
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = normalize_vowel_weights(band_means)
+            if history is None:
+                history = weights[:0]
+            recent_weights = np.concatenate([history, weights])
+            smoothed_weights = smooth_vowel_weights(recent_weights, smoothing_window, smoothing_method)
+            vowel_weights = scale_vowel_weights(smoothed_weights[len(history):], energy, max_Sxx, config)
+        if smoothing_method == 'ema':
+            history = smoothed_weights[-1:]
+        else:
+            history = recent_weights[max(len(recent_weights) - (smoothing_window - 1), 0):]
+        yield first_frame, vowel_weights
+        first_frame += len(vowel_weights)
+
+class StreamingVMDWriter:
+    """
+    Writes a VMD file of morph frames while they're still being made (like by stream_lipsync).
+    The file is a whole VMD after each add_morph_frames, so it can be loaded at any time.
+    """
+    def __init__(self, filename, model_name=""):
+        self.file = open(filename, 'wb')
+        self.morph_count = 0
+        self.file.write(VMDFile(model_name).header)
+        self.file.write(model_name.encode('shift-jis').ljust(20, b'\0'))
+        self.file.write(struct.pack('<I', 0)) # no bone frames
+        self.morph_count_offset = self.file.tell()
+        self.file.write(struct.pack('<I', 0))
+        self.file.write(struct.pack('<III', 0, 0, 0)) # no camera, light or shadow frames
+        self.file.flush()
+
+    def add_morph_frames(self, names, frames, weights):
+        # Add the morph frames after the ones already written (and the empty sections after them again)
+        self.file.seek(-12, os.SEEK_END)
+        self.file.write(b''.join(map(VMDMorphFrame.to_bytes, map(VMDMorphFrame, names, frames, weights))))
+        self.file.write(struct.pack('<III', 0, 0, 0))
+        self.morph_count += len(names)
+        self.file.seek(self.morph_count_offset)
+        self.file.write(struct.pack('<I', self.morph_count))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def open_stream_source(source):
+    """
+    Open the live audio source of run_stream_lipsync: '-' for stdin, or PORT / HOST:PORT to listen on (localhost if no host)
+    for one TCP connection. Returns (read, close) for read_pcm_stream.
+    """
+    if source == '-':
+        return sys.stdin.buffer.read1, lambda: None
+    host, _, port = source.rpartition(':')
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host or '127.0.0.1', int(port)))
+    server.listen(1)
+    print(f"Waiting for audio on {host or '127.0.0.1'}:{port}...")
+    connection, address = server.accept()
+    server.close()
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    print(f"Streaming audio from {address[0]}:{address[1]}")
+    return connection.recv, connection.close
+
+def run_stream_lipsync(source, sample_rate, channels, sample_format, config, output_format='json', output=None, model_name="Model"):
+    """
+    Live lip sync: read raw PCM audio from source (see open_stream_source) and write the vowel morph weights of
+    each frame as soon as it's analyzed (see stream_lipsync).
+    output_format:
+    'json': one JSON object per line, {"frame": n, "time": seconds, "weights": {morph: weight}}, written to
+    output (a file path, or a text stream like stdout)
+    'vmd': the morph frames in the VMD file output (see StreamingVMDWriter), on MMD's 30 fps timeline (see vmd_timeline_weights)
+    """
+    if output_format not in ('json', 'vmd'):
+        raise ValueError(f"Invalid stream output format: {output_format}")
+    if output_format == 'vmd' and not isinstance(output, str):
+        raise ValueError("The vmd stream output format needs an output file")
+    frame_rate = config.get('vmd_frame_rate', 30)
+    read, close_source = open_stream_source(source)
+    chunks = read_pcm_stream(read, channels, sample_format)
+    if output_format == 'vmd':
+        writer = StreamingVMDWriter(output, model_name)
+    else:
+        json_output = open(output, 'w', encoding='utf-8') if isinstance(output, str) else output
+
+    frame_count = 0
+    vmd_frame_count = 0
+    unpaired_weights = None # at 60 fps, a half frame whose pair is in the next block
+    try:
+        for first_frame, vowel_weights in stream_lipsync(chunks, sample_rate, config):
+            frame_count = first_frame + len(vowel_weights)
+            if output_format == 'vmd':
+                if unpaired_weights is not None:
+                    vowel_weights = np.concatenate([unpaired_weights, vowel_weights])
+                if frame_rate != 30:
+                    unpaired_weights = vowel_weights[len(vowel_weights) // 2 * 2:]
+                vmd_weights = vmd_timeline_weights(vowel_weights, frame_rate)
+                writer.add_morph_frames(list(VOWEL_RANGES) * len(vmd_weights), np.repeat(np.arange(vmd_frame_count, vmd_frame_count + len(vmd_weights)), len(VOWEL_RANGES)).tolist(),
+                                        list(vmd_weights.ravel()))
+                vmd_frame_count += len(vmd_weights)
+            else:
+                json_output.write(''.join(json.dumps({'frame': frame, 'time': round(frame / frame_rate, 6),
+                                                      'weights': {vowel: round(float(weight), 6) for vowel, weight in zip(VOWEL_RANGES, frame_weights)}},
+                                                     ensure_ascii=False) + '\n'
+                                          for frame, frame_weights in enumerate(vowel_weights, first_frame)))
+                json_output.flush()
+    finally:
+        close_source()
+        if output_format == 'vmd':
+            writer.close()
+        elif json_output is not output:
+            json_output.close()
+    print(f"Streamed {frame_count} frames ({frame_count / frame_rate:.2f} seconds)")
 
 def adjust_vowel_weights(weights, config):
     """Adjust vowel weights for more natural mouth movements using config values."""
@@ -713,7 +2379,22 @@ def adjust_vowel_weights(weights, config):
     total = sum(adjusted.values())
     return {v: w / total for v, w in adjusted.items()}
 
-def split_audio(audio_path, output_dir="", secondary_audio_path="", original_is_wav_filetype=True, max_duration=300, silence_threshold=-60, min_silence_length=300):
+def adjust_vowel_weights_array(weights, config):
+    """adjust_vowel_weights for a [frames, vowels] array of weights (in VOWEL_RANGES order)."""
+    adjusted = weights.copy()
+    a, i, u, o = (list(VOWEL_RANGES).index(vowel) for vowel in 'あいうお')
+    adjusted[adjusted[:, a] > 0.3, a] *= config['a_weight_multiplier'] # あ A
+    adjusted[adjusted[:, o] > 0.3, o] *= config['o_weight_multiplier'] # お O
+    adjusted[:, i] *= config['i_weight_multiplier'] # い I #GET extra width by adding to this number
+    adjusted[:, u] *= config['u_weight_multiplier'] # う U
+
+    total = adjusted[:, 0].copy()
+    for vowel_index in range(1, adjusted.shape[1]):
+        total += adjusted[:, vowel_index]
+    # a frame can end up with no weight at all (like a median over mostly silent frames), keep it closed instead of 0/0
+    return np.divide(adjusted, total[:, None], out=np.zeros_like(adjusted), where=total[:, None] > 0)
+
+def split_audio(audio_path, output_dir="", secondary_audio_path="", original_is_wav_filetype=True, max_duration=300, silence_threshold=-60, min_silence_length=300, export_parts=True):
     """
     Split an audio file into multiple parts, each not exceeding a specified maximum duration.
 
@@ -722,9 +2403,9 @@ def split_audio(audio_path, output_dir="", secondary_audio_path="", original_is_
     If no silence is found, it will split at the max_duration point.
 
     Parameters:
-    audio_path (str): Path to the input audio file.
+    audio_path (str or DecodedAudio): Path to the input audio file, or the already decoded audio.
     output_dir (str): Directory to save the split audio parts. If empty, uses the same directory as the input file.
-    secondary_audio_path (str): Split an additional audio file.
+    secondary_audio_path (str or DecodedAudio): Split an additional audio file.
                             However this audio file will split the exact same way as the one in audio_path.
                             This is useful for when you have full audio you want to split the same timestamps as a vocals-only audio. 
     max_duration (int): Maximum duration of each part in seconds. Default is 300 (5 minutes).
@@ -734,10 +2415,13 @@ def split_audio(audio_path, output_dir="", secondary_audio_path="", original_is_
     min_silence_length (int): Minimum length of silence to be considered for splitting, in milliseconds.
                               Default is 300 (0.3 seconds).
                               Increase this value if you want to split only at longer silences.
+    export_parts (bool): Save each part (and secondary part) as a wav file. If False, no part files are written,
+                         the parts are only (start, end) views over the split audio.
 
 
     Returns:
-    list: A list of file paths to the split audio parts.
+    list: The split audio parts as AudioPart views (or the file path, when the audio didn't need splitting),
+          and a list of file paths to the secondary audio parts.
 
     Notes:
     - The function will always keep the first 5 seconds of each segment intact and will not split within this period.
@@ -748,13 +2432,12 @@ def split_audio(audio_path, output_dir="", secondary_audio_path="", original_is_
     Example usage:
     split_audio("path/to/audio.mp3", output_dir="path/to/output", max_duration=300, silence_threshold=-45, min_silence_length=500)
     """
-    audio = AudioSegment.from_file(audio_path)
+    decoded_audio = get_decoded_audio(audio_path)
+    audio_path = decoded_audio.path
+    if original_is_wav_filetype and (max_duration == 0 or decoded_audio.duration <= max_duration):
+        return [audio_path], [] #no need to split audio, already short enough (known from the headers, without decoding it)
     # Set the frame rate to 44100Hz (and sample width to 16-bit) if needed
-    if audio.frame_rate != 44100:
-        #print(f"Sample rate is {audio.frame_rate}, resampling to 44100Hz 16-bit")
-        audio = audio.set_frame_rate(44100).set_sample_width(2)
-    #else:
-    #    print(f"Sample rate is already 44100Hz, so no need to resample")
+    audio = decoded_audio.segment_44100()
     if not output_dir:
         output_dir = os.path.dirname(audio_path)
     os.makedirs(output_dir, exist_ok=True)
@@ -773,69 +2456,61 @@ def split_audio(audio_path, output_dir="", secondary_audio_path="", original_is_
     start = 0
     part_num = 1
 
-    if secondary_audio_path != "":
-        secondary_audio = AudioSegment.from_file(secondary_audio_path)
+    if secondary_audio_path != "" and (export_parts or short_audio_needs_wav_conversion):
         # Set the frame rate to 44100Hz (and sample width to 16-bit) if needed
-        if secondary_audio.frame_rate != 44100:
-            #print(f"Sample rate is {secondary_audio.frame_rate}, resampling to 44100Hz 16-bit")
-            secondary_audio = secondary_audio.set_frame_rate(44100).set_sample_width(2)
-        #else:
-        #    print(f"Sample rate is already 44100Hz, so no need to resample")
+        secondary_audio = get_decoded_audio(secondary_audio_path).segment_44100()
+        secondary_audio_path = get_audio_path(secondary_audio_path)
         secondary_base_name = os.path.splitext(os.path.basename(secondary_audio_path))[0]
+    else:
+        secondary_audio_path = "" # the secondary audio is only needed for its exported parts
+
+    if short_audio_needs_wav_conversion:
+        # not split, just converted to a wav (with the secondary audio converted too)
+        output_file = os.path.join(output_dir, f"{base_name}.wav")
+        audio.export(output_file, format="wav")
+        output_files.append(output_file)
+        if secondary_audio_path != "":
+            secondary_output_file = os.path.join(output_dir, f"{secondary_base_name}_original.wav")
+            secondary_audio.export(secondary_output_file, format="wav")
+            secondary_output_files.append(secondary_output_file)
+        return output_files, secondary_output_files
+
+    # Find every silence of the whole file once, each split point is then looked up in it
+    silence_map = build_silence_map(audio, min_silence_length, silence_threshold)
 
     while start < len(audio):
         end = min(start + max_duration * 1000, len(audio))
-        
+
         if end - start < max_duration * 1000:
-            # This is the last segment, just export it
-            part = audio[start:end]
-            if short_audio_needs_wav_conversion == False:
-                output_file = os.path.join(output_dir, f"{base_name}_part{part_num}.wav")
-            else:
-                output_file = os.path.join(output_dir, f"{base_name}.wav")
-            part.export(output_file, format="wav")
-            output_files.append(output_file)
+            # This is the last segment
+            output_file = os.path.join(output_dir, f"{base_name}_part{part_num}.wav")
+            output_files.append(AudioPart(output_file, audio, start, end))
+            if export_parts:
+                audio[start:end].export(output_file, format="wav")
 
             if secondary_audio_path != "":
                 secondary_part = secondary_audio[start:end]
-                if short_audio_needs_wav_conversion == False:
-                    secondary_output_file = os.path.join(output_dir, f"{secondary_base_name}_original_part{part_num}.wav")
-                else:
-                    secondary_output_file = os.path.join(output_dir, f"{secondary_base_name}_original.wav")
+                secondary_output_file = os.path.join(output_dir, f"{secondary_base_name}_original_part{part_num}.wav")
                 secondary_part.export(secondary_output_file, format="wav")
                 secondary_output_files.append(secondary_output_file)
             break
 
-        # Search for silence in the entire segment
-        segment_to_search = audio[start:end]
-        silence_ranges = detect_silence(segment_to_search, 
-                                        min_silence_len=min_silence_length, 
-                                        silence_thresh=silence_threshold)
-        
-        if silence_ranges:
-            # Find the silence range closest to the max_duration point
-            target_time = max_duration * 1000
-            closest_silence = min(silence_ranges, key=lambda x: abs(x[0] - target_time))
-            split_point = start + closest_silence[0]
-        else:
+        # Find the silence in the entire segment closest to the max_duration point
+        # (not at the very start of the segment, that would make an empty part)
+        split_point = find_split_point(silence_map, start + 1, end - min_silence_length, start + max_duration * 1000)
+        if split_point is None:
             # If no silence found, split at max_duration
             split_point = end
 
-        part = audio[start:split_point]
-        if short_audio_needs_wav_conversion == False:
-            output_file = os.path.join(output_dir, f"{base_name}_part{part_num}.wav")
-        else:
-            output_file = os.path.join(output_dir, f"{base_name}.wav")
-        part.export(output_file, format="wav")
-        output_files.append(output_file)
+        output_file = os.path.join(output_dir, f"{base_name}_part{part_num}.wav")
+        output_files.append(AudioPart(output_file, audio, start, split_point))
+        if export_parts:
+            audio[start:split_point].export(output_file, format="wav")
 
         #del audio  # Clear the full audio reference after processing
         if secondary_audio_path != "":
             secondary_part = secondary_audio[start:split_point]
-            if short_audio_needs_wav_conversion == False:
-                secondary_output_file = os.path.join(output_dir, f"{secondary_base_name}_original_part{part_num}.wav")
-            else:
-                secondary_output_file = os.path.join(output_dir, f"{secondary_base_name}_original.wav")
+            secondary_output_file = os.path.join(output_dir, f"{secondary_base_name}_original_part{part_num}.wav")
             secondary_part.export(secondary_output_file, format="wav")
             secondary_output_files.append(secondary_output_file)
             # try:
@@ -849,6 +2524,55 @@ def split_audio(audio_path, output_dir="", secondary_audio_path="", original_is_
 
     return output_files, secondary_output_files
 
+def build_silence_map(audio_segment, min_silence_len=300, silence_thresh=-60):
+    """
+    Find every silence of audio_segment in one pass (see detect_silence), as a compact index to look up
+    split points in with find_split_point.
+
+    Returns (starts, ends): sorted arrays of the runs of silent min_silence_len long windows, in milliseconds.
+    Every window starting from starts[n] to ends[n] (included) is silent.
+    """
+    seg_len = len(audio_segment)
+    window_count = seg_len - min_silence_len + 1
+    if window_count <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    silence_thresh = db_to_float(silence_thresh) * audio_segment.max_possible_amplitude
+    if audio_segment.sample_width in (1, 2):
+        silent = get_sliding_rms(audio_segment, min_silence_len)[:window_count] <= silence_thresh
+    else:
+        silent = np.zeros(window_count, dtype=bool)
+        for silence_start, _ in detect_silence_by_slices(audio_segment, min_silence_len, silence_thresh, range(window_count)):
+            silent[silence_start] = True
+
+    # where the runs of silent windows start and stop
+    edges = np.diff(np.concatenate([[0], silent.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+def find_split_point(silence_map, first, last, target):
+    """
+    The start of the silent window (from build_silence_map) between first and last (included) that's
+    closest to target, the later one if two are as close. None if there's no silence there.
+    Only needs two binary searches in the silence map, so it's the same speed for any file length.
+    """
+    starts, ends = silence_map
+    if first > last:
+        return None
+    candidates = []
+    # the last silence at or before the target
+    before = min(target, last)
+    run = np.searchsorted(starts, before, side='right') - 1
+    if run >= 0 and min(ends[run], before) >= first:
+        candidates.append(int(min(ends[run], before)))
+    # the first silence after the target
+    after = max(target + 1, first)
+    run = np.searchsorted(ends, after, side='left')
+    if run < len(starts) and max(starts[run], after) <= last:
+        candidates.append(int(max(starts[run], after)))
+    if not candidates:
+        return None
+    return min(reversed(candidates), key=lambda silence_start: abs(silence_start - target))
+
 def detect_silence(audio_segment, min_silence_len=1000, silence_thresh=-40, seek_step=1):
     """
     Returns a list of all silent sections [start, end] in milliseconds of audio_segment.
@@ -862,21 +2586,68 @@ def detect_silence(audio_segment, min_silence_len=1000, silence_thresh=-40, seek
     # convert silence threshold to a float value (so we can compare it to rms)
     silence_thresh = db_to_float(silence_thresh) * audio_segment.max_possible_amplitude
 
-    # find silence and add start and end indices to the to_cut list
-    silence_ranges = []
-
     # check successive chunks of sound for silence
     # try a chunk at every "seek step" (or every chunk for a seek step == 1)
     last_slice_start = seg_len - min_silence_len
-    slice_starts = range(last_slice_start, -1, -seek_step)  # Reversed range for backwards search
+    slice_starts = np.arange(last_slice_start, -1, -seek_step)  # Reversed range for backwards search
+
+    if audio_segment.sample_width not in (1, 2):
+        # the sums of squares of wider samples don't fit exactly in 64 bits, check the chunks one by one
+        return detect_silence_by_slices(audio_segment, min_silence_len, silence_thresh, slice_starts)
+
+    # find silence and add start and end indices to the to_cut list
+    slice_rms = get_sliding_rms(audio_segment, min_silence_len)[slice_starts]
+    return [[int(i), int(i) + min_silence_len] for i in slice_starts[slice_rms <= silence_thresh]]
 
+def detect_silence_by_slices(audio_segment, min_silence_len, silence_thresh, slice_starts):
+    # The original silence check, the rms of each slice one by one (silence_thresh as an amplitude, not dB)
+    silence_ranges = []
     for i in slice_starts:
-        audio_slice = audio_segment[i:i + min_silence_len]
+        audio_slice = audio_segment[int(i):int(i) + min_silence_len]
         if audio_slice.rms <= silence_thresh:
-            silence_ranges.append([i, i + min_silence_len])
-
+            silence_ranges.append([int(i), int(i) + min_silence_len])
     return silence_ranges
 
+def get_sliding_rms(audio_segment, window_ms, block_ms=60000):
+    """
+    The rms of audio_segment[i:i + window_ms] for every millisecond i, in one pass over the audio
+    (from a cumulative sum of the squared samples) instead of slicing and measuring every window.
+
+    Gives exactly what pydub's .rms (audioop.rms) gives for each slice: the same frames are picked for
+    each millisecond, all channels' samples count, missing frames at the end count as silence and the
+    result is rounded down. Only for 8 and 16-bit audio, where the sums are exact in 64-bit integers.
+    The audio is squared in blocks of block_ms, so it isn't copied all at once.
+    """
+    channels = audio_segment.channels
+    # audioop reads 8-bit samples as signed
+    samples = np.frombuffer(audio_segment.raw_data, dtype=np.int8 if audio_segment.sample_width == 1 else np.int16)
+    frame_count = len(samples) // channels
+    seg_len = len(audio_segment)
+
+    # the frame each millisecond starts at, like pydub slicing picks it
+    ms_frames = (np.arange(seg_len + 1) * (audio_segment.frame_rate / 1000.0)).astype(np.int64)
+    available_frames = np.minimum(ms_frames, frame_count)
+
+    # sum of the squared samples of each millisecond
+    ms_squares = np.zeros(seg_len, dtype=np.int64)
+    for block_start in range(0, seg_len, block_ms):
+        block_end = min(block_start + block_ms, seg_len)
+        first_frame = available_frames[block_start]
+        block = samples[first_frame * channels:available_frames[block_end] * channels].astype(np.int32)
+        block *= block # the squares of 8 and 16-bit samples fit in 32 bits
+        # (milliseconds past the end of the audio have no frames)
+        has_frames = np.flatnonzero(available_frames[block_start:block_end] < available_frames[block_start + 1:block_end + 1]) + block_start
+        if len(has_frames):
+            ms_squares[has_frames] = np.add.reduceat(block, (available_frames[has_frames] - first_frame) * channels, dtype=np.int64)
+    squares_before = np.concatenate([[0], np.cumsum(ms_squares)])
+
+    window_sums = squares_before[window_ms:] - squares_before[:len(squares_before) - window_ms]
+    window_samples = (ms_frames[window_ms:] - ms_frames[:len(ms_frames) - window_ms]) * channels
+    rms = np.zeros(len(window_sums))
+    has_samples = window_samples > 0
+    rms[has_samples] = np.floor(np.sqrt(window_sums[has_samples] / window_samples[has_samples]))
+    return rms
+
 def db_to_float(db, using_amplitude=True):
     """
     Converts the input db to a float, which represents the equivalent
@@ -901,9 +2672,11 @@ def load_progress(output_dir):
             return json.load(f)
     return None
 
-def process_single_file(input_file, output_dir, model_name, config, send_lips_data_to):
+def process_single_file(input_file, output_dir, model_name, config, send_lips_data_to, separated=None, decoded_audio=None):
     # This function contains the logic previously in the batch_process function,
     # but for a single file
+    # separated can be this file's separation result when it was already separated (see separate_short_clips),
+    # decoded_audio its DecodedAudio when it was already decoded
     file_extension = get_file_extension(input_file)
     if file_extension.lower() == '.vmd':
         # Handle VMD file optimization
@@ -915,20 +2688,42 @@ def process_single_file(input_file, output_dir, model_name, config, send_lips_da
         print(f"Optimized VMD file saved as: {output_file}")
         return
 
+    # The features of the file are cached, so when only the weight settings changed (multipliers, smoothing)
+    # the VMDs are made again from them, without decoding, separating or analyzing the audio again
+    feature_cache_key, cached_features = get_usable_cached_features(input_file, output_dir, config, send_lips_data_to)
+    if cached_features is not None:
+        print(f"Using the cached features of: {input_file}")
+        part_features = cached_features['parts']
+        for i, features in enumerate(part_features):
+            output_file = get_part_vmd_file(input_file, output_dir, i, len(part_features))
+            features_to_vmd(*features, output_file, model_name, config)
+        if send_lips_data_to:
+            if len(part_features) > 1:
+                unsplit_vmd_file = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(input_file))[0]}_unsplit.vmd")
+                features_to_vmd(*cached_features['unsplit'], unsplit_vmd_file, model_name, config)
+            else:
+                unsplit_vmd_file = output_file
+            send_lips_data(unsplit_vmd_file, output_file, send_lips_data_to, input_file, output_dir)
+        return part_features
+
     input_is_wav_filetype = False
     dependent_audio_to_split = ""
+    keep_intermediate_files = config.get('keep_intermediate_files', True) # False: only the VMD is written, everything else stays in memory
+    if decoded_audio is None:
+        decoded_audio = DecodedAudio(input_file) # decoded once (when first needed) and shared by every step below
     
     # Get the vocal separation mode from config
     separate_vocals_mode = config.get('separate_vocals', 'automatic')
     print(f"separate_vocals_mode = {separate_vocals_mode}")
 
+    # separated is the separation result from batching or the analysis, reused when extracting the vocals
     temp_base_name = os.path.splitext(os.path.basename(input_file))[0]
     if re.search(r'_vocals_only(_part\d+)?$', temp_base_name):
         # filename ends with _vocals_only or _vocals_only_partN, so already is vocals_only, skip
         input_audio_has_vocals = True
         input_audio_is_vocals_only = True
     elif separate_vocals_mode == 'automatic':
-        input_audio_has_vocals, input_audio_is_vocals_only = analyze_audio_for_vocals(input_file)
+        input_audio_has_vocals, input_audio_is_vocals_only, separated = analyze_audio_for_vocals(decoded_audio, return_separation=True, prescreen=config.get('vocal_prescreen', True), config=config, separated=separated)
     elif separate_vocals_mode == 'always':
         input_audio_has_vocals = True
         input_audio_is_vocals_only = False
@@ -938,29 +2733,37 @@ def process_single_file(input_file, output_dir, model_name, config, send_lips_da
 
     if not input_audio_is_vocals_only and input_audio_has_vocals:
         vocals_file = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(input_file))[0]}_vocals_only.wav")
-        dependent_audio_to_split = input_file
-        if not os.path.exists(vocals_file):
+        dependent_audio_to_split = decoded_audio
+        if not os.path.exists(vocals_file) or config.get('vocals_cache_dir', "vocals_cache"):
+            # with the vocals cache on, always extract (a cache hit skips the separation), so a stale same-named file isn't used
             print(f"Extracting vocals from: {input_file}")
-            extract_vocals(input_file, vocals_file)
+            vocals_audio = extract_vocals(decoded_audio, vocals_file, separated, config, keep_file=keep_intermediate_files)
         else:
             print(f"Using existing vocals file: {vocals_file}")
+            vocals_audio = vocals_file
+        vocal_parts_status = (True, True) # the vocals file (and its parts) is vocals-only
     else:
         vocals_file = input_file
+        vocals_audio = decoded_audio
+        vocal_parts_status = (input_audio_has_vocals, input_audio_is_vocals_only)
+    del separated # free the separated audio, it's not needed anymore
 
     if get_file_extension(input_file).lower() == "wav":
         input_is_wav_filetype = True
+    if not keep_intermediate_files:
+        input_is_wav_filetype = True # no wav copy for MMD is made, so short audio doesn't need converting here
 
-    vocal_parts, full_audio_parts = split_audio(vocals_file, output_dir, dependent_audio_to_split, input_is_wav_filetype, config.get('max_duration', 300))
+    vocal_parts, full_audio_parts = split_audio(vocals_audio, output_dir, dependent_audio_to_split, input_is_wav_filetype, config.get('max_duration', 300),
+                                                export_parts=config.get('export_split_parts', True) and keep_intermediate_files)
 
+    part_features = []
+    unsplit_features = None
     for i, vocal_part in enumerate(vocal_parts):
-        if len(vocal_parts)>1:
-            output_file = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(input_file))[0]}_part{i+1}.vmd")
-        else:
-            # only one part, file was not splitted
-            output_file = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(input_file))[0]}.vmd")
-        audio_to_vmd(vocal_part, output_file, model_name, config)
+        output_file = get_part_vmd_file(input_file, output_dir, i, len(vocal_parts))
+        # split parts are read from memory, and the unsplit audio itself is already decoded (or only in memory)
+        part_features.append(audio_to_vmd(vocals_audio if vocal_part == get_audio_path(vocals_audio) else vocal_part, output_file, model_name, config, vocal_parts_status))
         print(f"Processed part {i+1}:")
-        print(f"  Vocals file: {vocal_part}")
+        print(f"  Vocals file: {get_audio_path(vocal_part)}")
         
         if i < len(full_audio_parts):
             full_audio_part = full_audio_parts[i]
@@ -973,18 +2776,274 @@ def process_single_file(input_file, output_dir, model_name, config, send_lips_da
         if len(vocal_parts)>1:
             # Process the original unsplit audio file if the vmd file was in parts
             unsplit_vmd_file = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(input_file))[0]}_unsplit.vmd")
-            audio_to_vmd(input_file, unsplit_vmd_file, model_name, config)
+            unsplit_features = audio_to_vmd(decoded_audio, unsplit_vmd_file, model_name, config, (input_audio_has_vocals, input_audio_is_vocals_only))
         else:
             unsplit_vmd_file = output_file
-        
-        # Replace mouth frames in the target VMD file
-        lips_output_file = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(send_lips_data_to))[0]}_With_Lips_From_{os.path.splitext(os.path.basename(input_file))[0]}.vmd")
-        lips_output_file = trim_filename_if_needed(lips_output_file) #keeps filename from getting too long
-        print(f"Sending lips data to a copy of: {send_lips_data_to}")
-        replace_mouth_frames(unsplit_vmd_file, send_lips_data_to, lips_output_file, "AIOU")
-        print(f"Lips data sent to: {lips_output_file}")
-        if os.path.exists(unsplit_vmd_file) and unsplit_vmd_file != output_file:
-            os.remove(unsplit_vmd_file) # delete unneeded vmd file
+        send_lips_data(unsplit_vmd_file, output_file, send_lips_data_to, input_file, output_dir)
+
+    if feature_cache_key:
+        save_cached_features(get_cache_dir(config, 'feature_cache_dir', "feature_cache"), feature_cache_key, part_features, unsplit_features, config.get('feature_cache_max_mb', 256),
+                             vocals_separated=not input_audio_is_vocals_only and input_audio_has_vocals)
+    return part_features
+
+def get_usable_cached_features(input_file, output_dir, config, send_lips_data_to=""):
+    """
+    Look up the features of input_file in the feature cache (see load_cached_features) for process_single_file.
+    Returns (cache key, cached features). The cached features are None unless the VMDs can be made from them alone:
+    every other file the run would write (see get_intermediate_files) is already in output_dir, and the unsplit
+    features are there when the lips are sent. The key is None when the feature cache is off.
+    """
+    feature_cache_dir = get_cache_dir(config, 'feature_cache_dir', "feature_cache")
+    if not feature_cache_dir or not os.path.isfile(input_file):
+        return None, None
+    feature_cache_key = get_feature_cache_key(input_file, config, feature_cache_dir)
+    cached_features = load_cached_features(feature_cache_dir, feature_cache_key)
+    if cached_features is None:
+        return feature_cache_key, None
+    part_count = len(cached_features['parts'])
+    if send_lips_data_to and part_count > 1 and cached_features['unsplit'] is None:
+        return feature_cache_key, None
+    missing_files = [f for f in get_intermediate_files(input_file, output_dir, config, part_count, cached_features['vocals_separated'], send_lips_data_to)
+                     if not os.path.exists(f)]
+    if missing_files:
+        print(f"Cached features of {input_file} not used, the files made with them are missing: {', '.join(map(os.path.basename, missing_files))}")
+        return feature_cache_key, None
+    return feature_cache_key, cached_features
+
+def get_intermediate_files(input_file, output_dir, config, part_count, vocals_separated, send_lips_data_to=""):
+    # The files other than the VMDs that process_single_file writes for input_file (the vocals, the wavs for MMD and the split parts),
+    # part_count being how many parts it's split into and vocals_separated whether its vocals are separated
+    if not config.get('keep_intermediate_files', True):
+        return []
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    vocals_base_name = f"{base_name}_vocals_only" if vocals_separated else base_name
+    input_is_wav_filetype = get_file_extension(input_file).lower() == "wav"
+    files = []
+    if vocals_separated:
+        files.append(f"{base_name}_vocals_only.wav")
+    if part_count == 1 and not input_is_wav_filetype:
+        # converted to a wav by split_audio
+        files.append(f"{vocals_base_name}.wav")
+        if vocals_separated:
+            files.append(f"{base_name}_original.wav")
+    elif part_count > 1 and config.get('export_split_parts', True):
+        files += [f"{vocals_base_name}_part{part_num}.wav" for part_num in range(1, part_count + 1)]
+        if vocals_separated:
+            files += [f"{base_name}_original_part{part_num}.wav" for part_num in range(1, part_count + 1)]
+    if send_lips_data_to and part_count > 1 and not input_is_wav_filetype and config.get('save_converted_wav', True):
+        # converted by audio_to_vmd for the unsplit VMD
+        files.append(f"{base_name}.wav")
+    return [os.path.join(output_dir, f) for f in dict.fromkeys(files)]
+
+def get_part_vmd_file(input_file, output_dir, part_index, part_count):
+    # The VMD file of a split part of input_file
+    if part_count > 1:
+        return os.path.join(output_dir, f"{os.path.splitext(os.path.basename(input_file))[0]}_part{part_index+1}.vmd")
+    # only one part, file was not splitted
+    return os.path.join(output_dir, f"{os.path.splitext(os.path.basename(input_file))[0]}.vmd")
+
+# The settings a sweep can change: they're only applied to the features, so every variant is made from one analysis
+SWEEP_OPTIONS = ('a_weight_multiplier', 'i_weight_multiplier', 'o_weight_multiplier', 'u_weight_multiplier', 'smoothing_method', 'smoothing_window', 'optimize_vmd')
+
+def parse_sweep_grid(items):
+    """
+    The grid of settings of a sweep (see sweep_file) from --sweep: KEY=VALUE1,VALUE2 items, or one YAML file of
+    KEY: [VALUE1, VALUE2] lines. The values are read like config.yaml's. Returns {option: [values]}.
+    """
+    if len(items) == 1 and os.path.isfile(items[0]):
+        with open(items[0], 'r', encoding='utf-8') as f:
+            grid = yaml.safe_load(f) or {}
+        grid = {key: values if isinstance(values, list) else [values] for key, values in grid.items()}
+    else:
+        grid = {}
+        for item in items:
+            key, separator, values = item.partition('=')
+            if not separator:
+                raise ValueError(f"Invalid sweep option: {item}")
+            grid[key.strip()] = [yaml.safe_load(value) for value in values.split(',')]
+    for key in grid:
+        if key not in SWEEP_OPTIONS:
+            raise ValueError(f"Invalid sweep option: {key}")
+    return grid
+
+def get_sweep_variants(config, grid):
+    # Every combination of the grid's values, as (overrides, config with the overrides)
+    variants = []
+    for values in itertools.product(*grid.values()):
+        overrides = dict(zip(grid, values))
+        variants.append((overrides, dict(config, **overrides)))
+    return variants
+
+def _write_variant_in_worker(part_features, vmd_files, model_name, config):
+    # Runs in a worker process of sweep_file: the VMD files of one variant, returns the number of keyframes of each
+    return [features_to_vmd(*features, vmd_file, model_name, config) for features, vmd_file in zip(part_features, vmd_files)]
+
+def sweep_file(input_file, output_dir, model_name, config, grid, workers=1):
+    """
+    Make the VMDs of input_file for every combination of the settings in grid (see parse_sweep_grid), to compare them.
+    The file is processed once like process_single_file does (or its features come from the feature cache), then each
+    variant is only the weight post-processing of those features (features_to_vmd), written by workers processes at once.
+    The variants are named like the file's VMDs with _sweepN at the end. Prints a table of their settings and keyframe
+    counts and saves it as {name}_sweep.csv with them. Returns [(overrides, keyframe count)] of the variants.
+    """
+    part_features = process_single_file(input_file, output_dir, model_name, config, "")
+    if part_features is None:
+        return [] # not an audio file
+
+    variants = get_sweep_variants(config, grid)
+    part_files = [get_part_vmd_file(input_file, output_dir, i, len(part_features)) for i in range(len(part_features))]
+    variant_files = [[f"{os.path.splitext(part_file)[0]}_sweep{variant_index + 1}.vmd" for part_file in part_files] for variant_index in range(len(variants))]
+    print(f"Making {len(variants)} variants of: {input_file}")
+    workers = max(min(workers, len(variants)), 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            keyframe_counts = list(executor.map(_write_variant_in_worker, itertools.repeat(part_features), variant_files,
+                                                itertools.repeat(model_name), [variant_config for _, variant_config in variants]))
+    else:
+        keyframe_counts = [_write_variant_in_worker(part_features, vmd_files, model_name, variant_config) for vmd_files, (_, variant_config) in zip(variant_files, variants)]
+
+    # Summary table
+    summary_file = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(input_file))[0]}_sweep.csv")
+    header = ['variant'] + list(grid) + ['keyframes', 'vmd_files']
+    rows = [[variant_index + 1] + [overrides[key] for key in grid] + [sum(counts), ' '.join(os.path.basename(vmd_file) for vmd_file in vmd_files)]
+            for variant_index, ((overrides, _), counts, vmd_files) in enumerate(zip(variants, keyframe_counts, variant_files))]
+    with open(summary_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+    print("\nSweep summary:")
+    for row in [header] + rows:
+        print("  ".join(f"{str(value):<{width}}" for value, width in zip(row, widths)).rstrip())
+    print(f"Sweep summary saved to: {summary_file}")
+    return [(overrides, sum(counts)) for (overrides, _), counts in zip(variants, keyframe_counts)]
+
+def send_lips_data(unsplit_vmd_file, output_file, send_lips_data_to, input_file, output_dir):
+    # Replace mouth frames in the target VMD file (a copy of it) with the ones of the unsplit VMD of input_file
+    lips_output_file = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(send_lips_data_to))[0]}_With_Lips_From_{os.path.splitext(os.path.basename(input_file))[0]}.vmd")
+    lips_output_file = trim_filename_if_needed(lips_output_file) #keeps filename from getting too long
+    print(f"Sending lips data to a copy of: {send_lips_data_to}")
+    replace_mouth_frames(unsplit_vmd_file, send_lips_data_to, lips_output_file, "AIOU")
+    print(f"Lips data sent to: {lips_output_file}")
+    if os.path.exists(unsplit_vmd_file) and unsplit_vmd_file != output_file:
+        os.remove(unsplit_vmd_file) # delete unneeded vmd file
+
+def get_worker_thread_counts(config, workers):
+    # Split the CPU cores between the workers, unless the thread counts are set in config
+    intra_op_threads = config.get('torch_threads', 0)
+    if not intra_op_threads:
+        intra_op_threads = max(1, (os.cpu_count() or 1) // workers)
+    inter_op_threads = config.get('torch_interop_threads', 0)
+    if not inter_op_threads:
+        inter_op_threads = 1 # each worker already runs one file, so extra inter-op threads would only oversubscribe the cores
+    return intra_op_threads, inter_op_threads
+
+def _init_separation_worker(intra_op_threads, inter_op_threads):
+    # Runs once in each worker process of batch_process's worker pool
+    configure_torch_threads(intra_op_threads, inter_op_threads)
+
+def _process_file_in_worker(input_file, output_dir, model_name, config, send_lips_data_to):
+    # Runs one file in a worker process, returning the error message instead of raising it
+    try:
+        process_single_file(input_file, output_dir, model_name, config, send_lips_data_to)
+    except Exception as e:
+        logging.error(f"Error processing {input_file}: {str(e)}")
+        return str(e)
+    return None
+
+def batch_process_with_workers(input_files, output_dir, model_name, config, workers, send_lips_data_to="", show_final_complete_message=True):
+    """
+    Process files with a pool of worker processes, each one converting one file at a time.
+
+    The CPU cores are split between the workers (see get_worker_thread_counts), so several files
+    are separated at the same time without the workers fighting over the same cores.
+    """
+    total_files = len(input_files)
+    processed_files = 0
+    start_time = time.time()
+    intra_op_threads, inter_op_threads = get_worker_thread_counts(config, workers)
+    print(f"Processing {total_files} files with {workers} workers ({intra_op_threads} torch threads each)")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_separation_worker, initargs=(intra_op_threads, inter_op_threads)) as executor:
+        worker_config = dict(config, analysis_workers=1) # the cores are already split between the files
+        futures = {executor.submit(_process_file_in_worker, input_file, output_dir, model_name, worker_config, send_lips_data_to): input_file for input_file in input_files}
+        for future in as_completed(futures):
+            input_file = futures[future]
+            processed_files += 1
+            error = future.result()
+            if error is not None:
+                print(f"Error processing {input_file}: {error}")
+            else:
+                print(f"\nFinished file {processed_files} of {total_files}: {input_file}")
+
+            if show_final_complete_message == True:
+                elapsed_time = time.time() - start_time
+                estimated_time_left = (total_files - processed_files) * elapsed_time / processed_files
+                print(f"Processed {processed_files}/{total_files} files")
+                print(f"Elapsed time: {format_time(elapsed_time)}")
+                print(f"Estimated time left: {format_time(estimated_time_left)}")
+
+    if send_lips_data_to:
+        print("Batch processing complete. Lips data has been sent to the specified VMD file.")
+    elif show_final_complete_message == True:
+        print("Batch processing complete.")
+    print(f"Total time taken: {format_time(time.time() - start_time)}")
+
+def separate_short_clips(input_files, config, output_dir="", send_lips_data_to=""):
+    """
+    Separate all the short clips among input_files together with separate_vocals_batch().
+
+    Only clips up to 'separation_batch_max_seconds' long that process_single_file would separate are batched
+    (not VMD files, _vocals_only files, 'never' separation mode, clips the vocal pre-screen already decides, or
+    clips process_single_file makes from the feature cache with output_dir and send_lips_data_to).
+    The length is checked from the file headers first, so long files aren't decoded here.
+    Returns {input_file: (DecodedAudio, separation result or None)} to give to process_single_file, for every file
+    that was probed or decoded here (so it isn't probed or decoded again), with a separation result for the batched clips.
+    """
+    separate_vocals_mode = config.get('separate_vocals', 'automatic')
+    if separate_vocals_mode == 'never':
+        return {}
+    max_seconds = config.get('separation_batch_max_seconds', 15)
+    decoded_files = {} # every file looked at here, with its DecodedAudio (and its separation result once batched)
+    clip_files, decoded_clips, audios, sample_rates = [], [], [], []
+    for input_file in input_files:
+        base_name, extension = os.path.splitext(os.path.basename(input_file))
+        if extension.lower() == '.vmd' or re.search(r'_vocals_only(_part\d+)?$', base_name):
+            continue
+        decoded_audio = DecodedAudio(input_file)
+        try:
+            too_long = decoded_audio.duration > max_seconds # from the headers, without decoding it
+        except Exception as e:
+            print(f"Could not read {input_file} for batched separation, it will be separated on its own: {e}")
+            continue
+        if too_long or get_usable_cached_features(input_file, output_dir, config, send_lips_data_to)[1] is not None:
+            decoded_files[input_file] = (decoded_audio, None) # too long, or made from the cached features without separating
+            continue
+        try:
+            audio, sample_rate = load_audio_for_separation(decoded_audio)
+        except Exception as e:
+            print(f"Could not load {input_file} for batched separation, it will be separated on its own: {e}")
+            continue
+        decoded_files[input_file] = (decoded_audio, None)
+        if audio.shape[-1] > max_seconds * sample_rate:
+            continue # the header's duration was a little off
+        if separate_vocals_mode == 'automatic' and config.get('vocal_prescreen', True):
+            if prescreen_audio_for_vocals(audio, sample_rate, config=config) is not None:
+                continue # decided without separating, process_single_file's pre-screen gives the same answer
+        clip_files.append(input_file)
+        decoded_clips.append(decoded_audio)
+        audios.append(audio)
+        sample_rates.append(sample_rate)
+
+    if len(clip_files) < 2:
+        return decoded_files # nothing to gain, separate it normally
+    try:
+        separations = separate_vocals_batch(audios, sample_rates, config=config)
+    except Exception as e:
+        print(f"Batched separation failed, the clips will be separated one by one: {e}")
+        return decoded_files
+    decoded_files.update(zip(clip_files, zip(decoded_clips, separations)))
+    return decoded_files
 
 #def batch_process(input_files, output_dir, model_name, config, args):
 def batch_process(input_files, output_dir, model_name, config, global_start_time, item_start_time, audio_source_files_count=1, send_lips_data_to="", show_final_complete_message=True):
@@ -992,12 +3051,24 @@ def batch_process(input_files, output_dir, model_name, config, global_start_time
     processed_files = 0
     start_time = time.time()
 
-    for input_file in input_files:
+    workers = min(int(config.get('separation_workers', 1) or 1), total_files)
+    if workers > 1:
+        batch_process_with_workers(input_files, output_dir, model_name, config, workers, send_lips_data_to, show_final_complete_message)
+        return
+
+    # With separation_batch_size above 1, short clips are separated in batches before processing them
+    batch_size = max(int(config.get('separation_batch_size', 1) or 1), 1)
+    separations = {}
+
+    for file_index, input_file in enumerate(input_files):
+        if batch_size > 1 and file_index % batch_size == 0:
+            separations = separate_short_clips(input_files[file_index:file_index + batch_size], config, output_dir, send_lips_data_to)
         processed_files += 1
         print(f"\nProcessing file {processed_files} of {total_files}: {input_file}")
         
         try:
-            process_single_file(input_file, output_dir, model_name, config, send_lips_data_to)
+            decoded_audio, separated = separations.pop(input_file, (None, None))
+            process_single_file(input_file, output_dir, model_name, config, send_lips_data_to, separated, decoded_audio)
         except Exception as e:
             print(f"Error processing {input_file}: {str(e)}")
             logging.error(f"Error processing {input_file}: {str(e)}")
@@ -1018,6 +3089,7 @@ def batch_process(input_files, output_dir, model_name, config, global_start_time
         elif show_final_complete_message == True:
             print("Batch processing complete.")
 
+    release_separators() # the batch is done, don't keep the separation model in memory
     print(f"Total time taken: {format_time(time.time() - start_time)}")
 
     # Restart the script if there are more files to process
@@ -1116,11 +3188,38 @@ def load_config(config_file='config.yaml'):
     default_config['i_weight_multiplier'] = (0.8, "Intensity of the 'い' (I) sound. Increase to get general extra width mouth when talking.")
     default_config['o_weight_multiplier'] = (1.1, "Intensity of the 'お' (O) sound. Increase to get more of a general wide circle shape.")
     default_config['u_weight_multiplier'] = (0.9, "Intensity of the 'う' (U) sound. Increase to get more general small circle-shaped mouth.")
+    default_config['smoothing_method'] = ('mean', "How the vowel weights are smoothed over time: 'mean' (average of the last smoothing_window frames), 'ema' (exponential moving average, smoother fade-outs), 'median' (keeps quick mouth changes sharp) or 'none'.")
+    default_config['smoothing_window'] = (5, "Number of frames (at 30 per second) the vowel weights are smoothed over. Increase for calmer mouth movements, decrease for snappier ones.")
+    default_config['fast_band_energies'] = (True, "Work out the vowel band energies with a float32 spectrogram and a vowel filterbank, about twice as fast. Set to False for the full float64 spectrogram (exactly the lip sync of older versions).")
+    default_config['vmd_frame_rate'] = (30, "Frame rate the vowels are analyzed at: 30, or 60 to analyze each half frame on its own. VMD keyframes are always on MMD's 30 fps timeline (at 60 each is the average of its two half frames), the --stream JSON lines are at this rate. The frames always line up exactly with the audio, at any sample rate.")
+    default_config['analysis_window_size'] = (0, "Length in samples of the audio window analyzed for each frame, centered on the frame (0 = one frame long). A power of two like 1024 or 2048 keeps the analysis fast at 60 fps and can be longer than a frame for finer vowel detection.")
+    default_config['analysis_workers'] = (1, "Number of processes the VMD analysis of one long audio is split between (0 = one per CPU core, 1 = off). Works for wav files and the split parts and vocals kept in memory, other formats are analyzed in one process. Each worker gets at least a minute of audio, the VMD is exactly the same as with one.")
     default_config['max_duration'] = (300, "Maximum duration for splitting audio in seconds. Set to 0 to disable splitting.")
+    default_config['export_split_parts'] = (True, "Save each split part (and the full audio part) as a wav file, to load in MMD with its VMD part. If False, the parts are made into VMDs straight from memory without writing any part files.")
+    default_config['keep_intermediate_files'] = (True, "Keep the intermediate files (vocals-only wav, converted wav, split part wavs) in the output folder. If False, only the VMD files are written and everything else stays in memory (same as --no-intermediates).")
+    default_config['separation_chunk_seconds'] = (30, "Separate vocals in chunks of this many seconds (crossfaded together), so memory use stays the same for any audio length. Set to 0 to separate the whole file at once.")
+    default_config['separation_chunk_overlap_seconds'] = (1, "Overlap in seconds between separation chunks, used to crossfade them together.")
+    default_config['vocals_cache_dir'] = ("vocals_cache", "Folder where separated vocals are cached (keyed by the audio content and separation settings), so the same audio is never separated twice. A relative folder is inside the audio2vmd folder. While the cache is on, the vocals-only wavs are always written again from it instead of using an existing file with the same name. Leave empty to disable the cache.")
+    default_config['vocals_cache_max_mb'] = (2048, "Maximum size of the vocals cache in MB, the least recently used vocals are deleted when it gets bigger.")
+    default_config['feature_cache_dir'] = ("feature_cache", "Folder where the analyzed features of each audio file are cached (keyed by the file content and the analysis settings), so changing only the weight multipliers or the smoothing remakes the VMDs in moments. Leave empty to disable the cache.")
+    default_config['feature_cache_max_mb'] = (256, "Maximum size of the feature cache in MB, the least recently used features are deleted when it gets bigger.")
+    default_config['separation_profile'] = ("full", "Vocal separation profile: 'full' (best quality vocals) or 'lipsync' (much faster, mono and lower quality vocals that are still good enough for the lip sync).")
+    default_config['lipsync_sample_rate'] = (12000, "Sample rate of the vocals made with the 'lipsync' separation profile. Use a rate that divides evenly by 30 so the VMD frames stay exact.")
+    default_config['torch_threads'] = (0, "Number of CPU threads torch uses inside each separation (0 = torch default). With separation_workers above 1, 0 splits the cores evenly between the workers.")
+    default_config['torch_interop_threads'] = (0, "Number of separation operations torch can run at the same time (0 = torch default, or 1 per worker with separation_workers above 1).")
+    default_config['separation_workers'] = (1, "Number of files to convert at the same time in a batch. Each worker gets its share of the CPU cores, which uses many-core CPUs much better than one big separation.")
+    default_config['separation_batch_size'] = (1, "Number of short clips separated together in one batch (1 = off). Speeds up batches of many short voice lines a lot, not used with separation_workers above 1.")
+    default_config['separation_batch_max_seconds'] = (15, "Only clips up to this many seconds long are separated in batches, longer files are separated on their own.")
+    default_config['separation_batch_max_padding'] = (0.1, "Most silence padding a clip gets in a separation batch, as a fraction of its length (clips are padded to the longest in their batch). The padding changes the separated vocals slightly over the whole clip, so batched results are close to, not the same as, separating each clip on its own. 0 only batches clips of the same length.")
+    default_config['separator_backend'] = ("eager", "How the separation model runs: 'eager' (normal PyTorch), 'torchscript' or 'onnx' (the model is exported once to exported_models_dir, onnx needs onnxruntime installed). Exported backends run on the CPU.")
+    default_config['separator_precision'] = ("float32", "Precision of the separation model: 'float32' (best quality), 'int8' (quantized, much faster on the CPU) or 'bfloat16' (not with onnx). Anything other than float32 runs on the CPU.")
+    default_config['exported_models_dir'] = ("exported_models", "Folder where the exported separation models are saved for the torchscript and onnx separator backends.")
+    default_config['save_converted_wav'] = (True, "Save a wav copy of input files that aren't wavs (so you have a wav to load in MMD). Set to False to make the VMD straight from the decoded audio without writing that wav.")
     default_config['optimize_vmd'] = (True, "Automatically optimize the VMD file True, highly recommended to keep this true.")
     default_config['extras_optimize_vmd_bone_position_tolerance'] = (0.005, "For Optimizing a VMD (in Extras) with bone position data. Use a tolerance of 0.001 for very high fidelity, but it might not reduce the file size much.")
     default_config['extras_optimize_vmd_bone_rotation_tolerance'] = (0.005, "For Optimizing a VMD (in Extras) with bone rotation data. Use a tolerance of 0.001 for very high fidelity, but it might not reduce the file size much.")
     default_config['separate_vocals'] = ('automatic', 'Vocal separation mode. Options: automatic, always, never')
+    default_config['vocal_prescreen'] = (True, "With 'automatic' vocal separation, first try a fast check (audio statistics and a few short excerpts) and only separate the whole file to detect vocals when that is unclear.")
 
     if os.path.exists(config_file):
         print(f"Configuration file found. Loading...")
@@ -1157,11 +3256,33 @@ if __name__ == "__main__":
     parser.add_argument("--config", "-c", type=Path, default="config.yaml", help="Path to configuration file")
     parser.add_argument("--extras-mode", choices=["OPTIMIZE_VMD", "REPLACE_LIPS", ""], default="", help="Extra processing mode")
     parser.add_argument('--show-final-complete-message', type=str2bool, default="True", help='Tells to show the final complete message (used for looping).')
+    parser.add_argument("--threads", type=int, default=None, help="Torch intra-op CPU threads for separation (0 = torch default, overrides config)")
+    parser.add_argument("--interop-threads", type=int, default=None, help="Torch inter-op CPU threads for separation (0 = torch default, overrides config)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of files to convert at the same time, the CPU cores are split between them (overrides config)")
+    parser.add_argument("--no-intermediates", action="store_true", help="Only write the VMD files, keep the vocals, converted wav and split parts in memory (overrides config)")
+    parser.add_argument("--sweep", nargs='+', help="Make a VMD for every combination of settings, from one analysis of each input: KEY=VALUE1,VALUE2 ... or a YAML file of KEY: [VALUES] (" + ", ".join(SWEEP_OPTIONS) + ")")
+    parser.add_argument("--stream", action="store_true",help="Live lip sync: read raw PCM audio from --stream-source and write the vowel morph weights frame by frame")
+    parser.add_argument("--stream-source", default="-", help="Where the live audio comes from: - for stdin, or PORT / HOST:PORT to listen on for a TCP connection")
+    parser.add_argument("--stream-rate", type=int, default=44100, help="Sample rate of the live audio")
+    parser.add_argument("--stream-channels", type=int, default=1, help="Number of channels of the live audio")
+    parser.add_argument("--stream-sample-format", choices=list(PCM_SAMPLE_FORMATS), default="s16le", help="Sample format of the live audio")
+    parser.add_argument("--stream-format", choices=["json", "vmd"], default="json", help="Write the weights as JSON lines, or as morph frames of a VMD file (needs --stream-output)")
+    parser.add_argument("--stream-output", default="", help="File to write the live weights to (stdout for JSON lines if not given)")
      
     
     args = parser.parse_args()
     #print(f"---args_before=<{args}>")
     
+    if args.stream:
+        # the weights can be written to stdout, so everything else printed goes to stderr
+        stream_output = args.stream_output or sys.stdout
+        sys.stdout = sys.stderr
+        config = load_config(str(args.config))
+        model_name = args.model if args.model not in ("Model", "") else config.get('model_name', "Model")
+        run_stream_lipsync(args.stream_source, args.stream_rate, args.stream_channels, args.stream_sample_format, config,
+                           args.stream_format, stream_output, model_name)
+        sys.exit(0)
+
     if not args.input:
         parser.print_help()
         print("\nExamples:")
@@ -1204,7 +3325,16 @@ if __name__ == "__main__":
     #print(f"===test input args = <{args.input}>")
 
     config = load_config(args.config)
+    if args.threads is not None:
+        config['torch_threads'] = args.threads
+    if args.interop_threads is not None:
+        config['torch_interop_threads'] = args.interop_threads
+    if args.workers is not None:
+        config['separation_workers'] = args.workers
+    if args.no_intermediates:
+        config['keep_intermediate_files'] = False
     print_config(config)
+    configure_torch_threads(config.get('torch_threads', 0), config.get('torch_interop_threads', 0))
 
     if not os.path.exists(args.output):
         os.makedirs(args.output)
@@ -1264,6 +3394,11 @@ if __name__ == "__main__":
         extras_output_path = os.path.join(args.output, f"{os.path.splitext(os.path.basename(args.send_lips_data_to))[0]}_With_Lips_From_{os.path.splitext(os.path.basename(args.input[0]))[0]}.vmd")
         replace_mouth_frames(args.input[0], args.send_lips_data_to, extras_output_path)
         print(f"VMD with replaced lips data saved to: {extras_output_path}")
+    elif args.sweep:
+        grid = parse_sweep_grid(args.sweep)
+        sweep_workers = args.workers if args.workers is not None else (os.cpu_count() or 1) # processes writing the variants
+        for input_file in input_files:
+            sweep_file(input_file, args.output, args.model, config, grid, sweep_workers)
     else:
         # Existing batch processing logic
         batch_process(input_files, args.output, args.model, config, start_time, item_start_time, audio_source_files_count, args.send_lips_data_to, args.show_final_complete_message)
@@ -50,11 +50,38 @@ class Audio2VMDGui:
     DEFAULT_CONFIG = CommentedConfig({
         'model_name': ("Model", "Name of the model the VMD is for. (max length of 20 characters)"),
         'separate_vocals': ("automatic", "Controls vocal separation behavior: 'automatic' (detect and separate if needed), 'always' (skip detection and always separate), or 'never' (skip detection and assume file is already vocals-only). 'automatic' recommended if any of your files have music/background noise, otherwise 'never' is recommended for a big speed boost."),
+        'vocal_prescreen': (True, "With 'automatic' vocal separation, first try a fast check (audio statistics and a few short excerpts) and only separate the whole file to detect vocals when that is unclear."),
         'a_weight_multiplier': (1.2, "Intensity of the 'あ' (A) sound. Increase to make mouth generally open bigger."),
         'i_weight_multiplier': (0.8, "Intensity of the 'い' (I) sound. Increase to get general extra width mouth when talking."),
         'o_weight_multiplier': (1.1, "Intensity of the 'お' (O) sound. Increase to get more of a general wide medium circle shape."),
         'u_weight_multiplier': (0.9, "Intensity of the 'う' (U) sound. Increase to get more general small circle-shaped mouth."),
+        'smoothing_method': ('mean', "How the vowel weights are smoothed over time: 'mean' (average of the last smoothing_window frames), 'ema' (exponential moving average, smoother fade-outs), 'median' (keeps quick mouth changes sharp) or 'none'."),
+        'smoothing_window': (5, "Number of frames (at 30 per second) the vowel weights are smoothed over. Increase for calmer mouth movements, decrease for snappier ones."),
+        'fast_band_energies': (True, "Work out the vowel band energies with a float32 spectrogram and a vowel filterbank, about twice as fast. Set to False for the full float64 spectrogram (exactly the lip sync of older versions)."),
+        'vmd_frame_rate': (30, "Frame rate the vowels are analyzed at: 30, or 60 to analyze each half frame on its own. VMD keyframes are always on MMD's 30 fps timeline (at 60 each is the average of its two half frames), the --stream JSON lines are at this rate. The frames always line up exactly with the audio, at any sample rate."),
+        'analysis_window_size': (0, "Length in samples of the audio window analyzed for each frame, centered on the frame (0 = one frame long). A power of two like 1024 or 2048 keeps the analysis fast at 60 fps and can be longer than a frame for finer vowel detection."),
+        'analysis_workers': (1, "Number of processes the VMD analysis of one long audio is split between (0 = one per CPU core, 1 = off). Works for wav files and the split parts and vocals kept in memory, other formats are analyzed in one process. Each worker gets at least a minute of audio, the VMD is exactly the same as with one."),
         'max_duration': (300, "Maximum duration for splitting audio in seconds. Set to 0 to disable splitting."),
+        'export_split_parts': (True, "Save each split part (and the full audio part) as a wav file, to load in MMD with its VMD part. If False, the parts are made into VMDs straight from memory without writing any part files."),
+        'keep_intermediate_files': (True, "Keep the intermediate files (vocals-only wav, converted wav, split part wavs) in the output folder. If False, only the VMD files are written and everything else stays in memory (same as --no-intermediates)."),
+        'separation_chunk_seconds': (30, "Separate vocals in chunks of this many seconds (crossfaded together), so memory use stays the same for any audio length. Set to 0 to separate the whole file at once."),
+        'separation_chunk_overlap_seconds': (1, "Overlap in seconds between separation chunks, used to crossfade them together."),
+        'vocals_cache_dir': ("vocals_cache", "Folder where separated vocals are cached (keyed by the audio content and separation settings), so the same audio is never separated twice. A relative folder is inside the audio2vmd folder. While the cache is on, the vocals-only wavs are always written again from it instead of using an existing file with the same name. Leave empty to disable the cache."),
+        'vocals_cache_max_mb': (2048, "Maximum size of the vocals cache in MB, the least recently used vocals are deleted when it gets bigger."),
+        'feature_cache_dir': ("feature_cache", "Folder where the analyzed features of each audio file are cached (keyed by the file content and the analysis settings), so changing only the weight multipliers or the smoothing remakes the VMDs in moments. Leave empty to disable the cache."),
+        'feature_cache_max_mb': (256, "Maximum size of the feature cache in MB, the least recently used features are deleted when it gets bigger."),
+        'separation_profile': ("full", "Vocal separation profile: 'full' (best quality vocals) or 'lipsync' (much faster, mono and lower quality vocals that are still good enough for the lip sync)."),
+        'lipsync_sample_rate': (12000, "Sample rate of the vocals made with the 'lipsync' separation profile. Use a rate that divides evenly by 30 so the VMD frames stay exact."),
+        'torch_threads': (0, "Number of CPU threads torch uses inside each separation (0 = torch default). With separation_workers above 1, 0 splits the cores evenly between the workers."),
+        'torch_interop_threads': (0, "Number of separation operations torch can run at the same time (0 = torch default, or 1 per worker with separation_workers above 1)."),
+        'separation_workers': (1, "Number of files to convert at the same time in a batch. Each worker gets its share of the CPU cores, which uses many-core CPUs much better than one big separation."),
+        'separation_batch_size': (1, "Number of short clips separated together in one batch (1 = off). Speeds up batches of many short voice lines a lot, not used with separation_workers above 1."),
+        'separation_batch_max_seconds': (15, "Only clips up to this many seconds long are separated in batches, longer files are separated on their own."),
+        'separation_batch_max_padding': (0.1, "Most silence padding a clip gets in a separation batch, as a fraction of its length (clips are padded to the longest in their batch). The padding changes the separated vocals slightly over the whole clip, so batched results are close to, not the same as, separating each clip on its own. 0 only batches clips of the same length."),
+        'separator_backend': ("eager", "How the separation model runs: 'eager' (normal PyTorch), 'torchscript' or 'onnx' (the model is exported once to exported_models_dir, onnx needs onnxruntime installed). Exported backends run on the CPU."),
+        'separator_precision': ("float32", "Precision of the separation model: 'float32' (best quality), 'int8' (quantized, much faster on the CPU) or 'bfloat16' (not with onnx). Anything other than float32 runs on the CPU."),
+        'exported_models_dir': ("exported_models", "Folder where the exported separation models are saved for the torchscript and onnx separator backends."),
+        'save_converted_wav': (True, "Save a wav copy of input files that aren't wavs (so you have a wav to load in MMD). Set to False to make the VMD straight from the decoded audio without writing that wav."),
         'optimize_vmd': (True, "Automatically optimize the VMD file if True, highly recommended to keep this true."),
         'extras_optimize_vmd_bone_position_tolerance': (0.005, "For Optimizing a VMD (in Extras) with bone position data. Use a tolerance of 0.001 for very high fidelity, but it might not reduce the file size much."),
         'extras_optimize_vmd_bone_rotation_tolerance': (0.005, "For Optimizing a VMD (in Extras) with bone rotation data. Use a tolerance of 0.001 for very high fidelity, but it might not reduce the file size much.")
@@ -316,7 +343,7 @@ class Audio2VMDGui:
                     elif isinstance(default_value, float):
                         value = float(value) if value != '' else default_value
                 else:
-                    value = default_value  # Fallback in case of unexpected type
+                    value = self.config.get(key, default_value)  # Settings without a widget keep their loaded value
 
                 config[key] = (value, comment)
             except (ValueError, AttributeError) as e:
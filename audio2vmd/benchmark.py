@@ -0,0 +1,490 @@
+#=======================================
+# Benchmarks for audio2vmd
+# Compares the speed and the VMD output of different audio2vmd settings on your own audio files
+#=======================================
+# Usage (from the audio2vmd folder, with the virtual environment activated):
+#   python benchmark.py lipsync-profile input_audio.mp3
+#   python benchmark.py backends input_audio.mp3
+#   python benchmark.py silence input_audio.mp3
+#   python benchmark.py split input_audio.mp3
+#   python benchmark.py vowels input_audio.mp3
+#   python benchmark.py band-energies input_audio.mp3
+#   python benchmark.py stream
+import os
+import time
+import threading
+import copy
+import tempfile
+import argparse
+import numpy as np
+import audio2vmd
+
+
+def read_vowel_weights(vmd_file):
+    # Get the vowel morph weights of a VMD file as {vowel: {frame: weight}}
+    vmd = audio2vmd.VMDFile()
+    vmd.load(vmd_file)
+    weights = {vowel: {} for vowel in 'あいうお'}
+    for morph in vmd.morph_frames:
+        if morph.name in weights:
+            weights[morph.name][morph.frame] = morph.weight
+    return weights, len(vmd.morph_frames)
+
+def compare_vmd_files(reference_vmd_file, test_vmd_file):
+    """
+    Compare the vowel morphs of two VMD files made without optimization (so both have every frame).
+    Returns {vowel: (mean absolute difference, max absolute difference, correlation)}.
+    """
+    reference_weights, _ = read_vowel_weights(reference_vmd_file)
+    test_weights, _ = read_vowel_weights(test_vmd_file)
+    results = {}
+    for vowel in reference_weights:
+        frames = sorted(set(reference_weights[vowel]) & set(test_weights[vowel]))
+        reference = np.array([reference_weights[vowel][frame] for frame in frames])
+        test = np.array([test_weights[vowel][frame] for frame in frames])
+        difference = np.abs(reference - test)
+        if len(frames) > 1 and np.std(reference) > 0 and np.std(test) > 0:
+            correlation = float(np.corrcoef(reference, test)[0, 1])
+        else:
+            correlation = float('nan')
+        results[vowel] = (float(np.mean(difference)) if len(frames) else 0.0, float(np.max(difference)) if len(frames) else 0.0, correlation)
+    return results
+
+def benchmark_lipsync_profile(input_file, config, seconds=0):
+    """
+    Separate the vocals of input_file with the 'full' and the 'lipsync' separation profiles,
+    then make a VMD from each one and compare the separation time and the VMD output.
+    """
+    audio, sample_rate = audio2vmd.load_audio_for_separation(input_file)
+    if seconds:
+        audio = audio[..., :int(seconds * sample_rate)]
+    print(f"Benchmarking {os.path.basename(input_file)} ({audio.shape[-1] / sample_rate:.1f} seconds of audio)")
+
+    base_config = dict(config)
+    base_config['vocals_cache_dir'] = "" # always really separate
+    base_config['separate_vocals'] = 'never' # the vocals are given directly to audio_to_vmd
+    base_config['optimize_vmd'] = False # keep every frame so the VMDs can be compared frame by frame
+
+    # load the model first, so loading time isn't counted
+    audio2vmd.get_separator(niter=1)
+    audio2vmd.get_separator(niter=0)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for profile in ('full', 'lipsync'):
+            profile_config = copy.deepcopy(base_config)
+            profile_config['separation_profile'] = profile
+            start_time = time.time()
+            separated = audio2vmd.separate_vocals(audio, sample_rate, config=profile_config)
+            separation_time = time.time() - start_time
+
+            vocals_file = os.path.join(temp_dir, f"{profile}_vocals_only.wav")
+            audio2vmd.save_vocals_wav(separated['vocals'], separated['sample_rate'], vocals_file)
+            vmd_file = os.path.join(temp_dir, f"{profile}.vmd")
+            start_time = time.time()
+            audio2vmd.audio_to_vmd(vocals_file, vmd_file, "Model", profile_config, (True, True))
+            vmd_time = time.time() - start_time
+            results[profile] = (separation_time, vmd_time, vmd_file, separated['sample_rate'])
+
+        comparison = compare_vmd_files(results['full'][2], results['lipsync'][2])
+
+    print("\nProfile   Separation time   VMD time   Vocals sample rate")
+    for profile, (separation_time, vmd_time, _, vocals_rate) in results.items():
+        print(f"{profile:<9} {separation_time:>14.2f}s {vmd_time:>9.2f}s   {vocals_rate}Hz")
+    print(f"Separation speed-up: {results['full'][0] / results['lipsync'][0]:.2f}x")
+    print("\nVMD change (lipsync compared to full):")
+    print("Vowel   Mean abs diff   Max abs diff   Correlation")
+    for vowel, (mean_difference, max_difference, correlation) in comparison.items():
+        print(f"{vowel:<6} {mean_difference:>14.4f} {max_difference:>14.4f} {correlation:>13.3f}")
+    return results, comparison
+
+def get_snr(reference, test):
+    # Signal to noise ratio in dB of test compared to reference
+    length = min(reference.shape[-1], test.shape[-1])
+    reference = reference[..., :length].double()
+    noise = test[..., :length].double() - reference
+    noise_power = float(noise.pow(2).sum())
+    if noise_power == 0:
+        return float('inf')
+    return 10 * np.log10(float(reference.pow(2).sum()) / noise_power)
+
+def benchmark_backends(input_file, config, backends=None, seconds=0):
+    """
+    Separate the vocals of input_file with every separator backend/precision in backends
+    (default: all of them) and compare the separation time and vocals quality to eager float32.
+    The quality is the SNR of the vocals (higher is closer to eager float32, inf = identical)
+    and the mean absolute difference of the vowel weights of the VMD made from them.
+    """
+    if backends is None:
+        backends = [(backend, precision) for backend in ('eager', 'torchscript', 'onnx')
+                    for precision in ('float32', 'int8', 'bfloat16') if not (backend == 'onnx' and precision == 'bfloat16')]
+    if ('eager', 'float32') not in backends:
+        backends = [('eager', 'float32')] + list(backends)
+
+    audio, sample_rate = audio2vmd.load_audio_for_separation(input_file)
+    if seconds:
+        audio = audio[..., :int(seconds * sample_rate)]
+    print(f"Benchmarking {os.path.basename(input_file)} ({audio.shape[-1] / sample_rate:.1f} seconds of audio)")
+
+    base_config = dict(config)
+    base_config['vocals_cache_dir'] = "" # always really separate
+    base_config['separate_vocals'] = 'never'
+    base_config['optimize_vmd'] = False
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for backend, precision in backends:
+            backend_config = copy.deepcopy(base_config)
+            backend_config['separator_backend'] = backend
+            backend_config['separator_precision'] = precision
+            settings = audio2vmd.get_separation_settings(backend_config)
+            try:
+                # load (and export) the model first, so that time isn't counted
+                device = None if (backend, precision) == ('eager', 'float32') else 'cpu'
+                audio2vmd.get_separator(niter=settings['niter'], wiener_win_len=settings['wiener_win_len'], device=device,
+                                        backend=backend, precision=precision,
+                                        export_dir=backend_config.get('exported_models_dir', "exported_models"))
+                start_time = time.time()
+                separated = audio2vmd.separate_vocals(audio, sample_rate, config=backend_config)
+                separation_time = time.time() - start_time
+            except (ImportError, ValueError, RuntimeError) as e:
+                print(f"Skipping {backend} {precision}: {e}")
+                continue
+
+            vmd_file = os.path.join(temp_dir, f"{backend}_{precision}.vmd")
+            vocals_file = os.path.join(temp_dir, f"{backend}_{precision}_vocals_only.wav")
+            audio2vmd.save_vocals_wav(separated['vocals'], separated['sample_rate'], vocals_file)
+            audio2vmd.audio_to_vmd(vocals_file, vmd_file, "Model", backend_config, (True, True))
+            results[(backend, precision)] = (separation_time, separated['vocals'], vmd_file)
+
+        reference_time, reference_vocals, reference_vmd = results[('eager', 'float32')]
+        print("\nBackend      Precision   Separation time   Speed-up   Vocals SNR   VMD mean abs diff")
+        for (backend, precision), (separation_time, vocals, vmd_file) in results.items():
+            snr = get_snr(reference_vocals, vocals)
+            comparison = compare_vmd_files(reference_vmd, vmd_file)
+            vmd_difference = np.mean([mean_difference for mean_difference, _, _ in comparison.values()])
+            print(f"{backend:<12} {precision:<10} {separation_time:>15.2f}s {reference_time / separation_time:>9.2f}x {snr:>9.1f}dB {vmd_difference:>19.4f}")
+    return results
+
+def benchmark_silence_detection(input_file, seconds=300, min_silence_len=300, silence_threshold=-60):
+    """
+    Time the silence search split_audio does on the first seconds of input_file (like a max_duration
+    of that length), with the vectorized detect_silence and with the original slice by slice rms check,
+    and check both find exactly the same silences.
+    """
+    audio = audio2vmd.DecodedAudio(input_file).segment_44100()
+    if seconds:
+        audio = audio[:int(seconds * 1000)]
+    print(f"Benchmarking {os.path.basename(input_file)} ({len(audio) / 1000:.1f} seconds of audio, {audio.channels} channels)")
+
+    start_time = time.time()
+    silence_ranges = audio2vmd.detect_silence(audio, min_silence_len=min_silence_len, silence_thresh=silence_threshold)
+    vectorized_time = time.time() - start_time
+
+    silence_thresh = audio2vmd.db_to_float(silence_threshold) * audio.max_possible_amplitude
+    slice_starts = range(len(audio) - min_silence_len, -1, -1)
+    start_time = time.time()
+    reference_ranges = audio2vmd.detect_silence_by_slices(audio, min_silence_len, silence_thresh, slice_starts)
+    slices_time = time.time() - start_time
+
+    print("\nMethod        Time       Silent windows")
+    print(f"{'slices':<12} {slices_time:>7.3f}s {len(reference_ranges):>14}")
+    print(f"{'vectorized':<12} {vectorized_time:>7.3f}s {len(silence_ranges):>14}")
+    print(f"Speed-up: {slices_time / vectorized_time:.1f}x")
+    print(f"Same silences found: {silence_ranges == reference_ranges}")
+    return slices_time, vectorized_time, silence_ranges == reference_ranges
+
+def benchmark_split_points(input_file, max_duration=300, min_silence_len=300, silence_threshold=-60):
+    """
+    Time finding all the split points of input_file (like split_audio with max_duration) from one silence map,
+    compared to searching each segment for silence again with detect_silence, and check both give the same points.
+    """
+    audio = audio2vmd.DecodedAudio(input_file).segment_44100()
+    print(f"Benchmarking {os.path.basename(input_file)} ({len(audio) / 1000:.1f} seconds of audio, max_duration {max_duration}s)")
+
+    def get_split_points(find_split_point):
+        split_points = []
+        start = 0
+        while len(audio) - start >= max_duration * 1000:
+            end = start + max_duration * 1000
+            split_point = find_split_point(start, end)
+            start = split_point if split_point is not None else end
+            split_points.append(start)
+        return split_points
+
+    def search_segment(start, end):
+        # the search split_audio did before the silence map, on each segment
+        silence_ranges = audio2vmd.detect_silence(audio[start:end], min_silence_len=min_silence_len, silence_thresh=silence_threshold)
+        silence_ranges = [silence_range for silence_range in silence_ranges if silence_range[0] > 0]
+        if not silence_ranges:
+            return None
+        return start + min(silence_ranges, key=lambda x: abs(x[0] - max_duration * 1000))[0]
+
+    start_time = time.time()
+    segment_points = get_split_points(search_segment)
+    segments_time = time.time() - start_time
+
+    start_time = time.time()
+    silence_map = audio2vmd.build_silence_map(audio, min_silence_len, silence_threshold)
+    map_time = time.time() - start_time
+    start_time = time.time()
+    map_points = get_split_points(lambda start, end: audio2vmd.find_split_point(silence_map, start + 1, end - min_silence_len, start + max_duration * 1000))
+    lookup_time = time.time() - start_time
+
+    print("\nMethod              Time")
+    print(f"{'segment searches':<18} {segments_time:>7.3f}s")
+    print(f"{'silence map':<18} {map_time:>7.3f}s (built once, {len(silence_map[0])} silences)")
+    print(f"{'map lookups':<18} {lookup_time * 1000:>7.3f}ms ({len(map_points)} split points)")
+    print(f"Same split points: {segment_points == map_points}")
+    return segments_time, map_time, lookup_time, segment_points == map_points
+
+def frame_by_frame_vowel_weights(f, Sxx, config, smoothing_window=5):
+    # The vowel weights the way audio_to_vmd worked them out before compute_vowel_weights, one frame at a time
+    max_Sxx = np.max(Sxx)
+    vowel_weights_history = []
+    frame_weights = []
+    for frame in range(Sxx.shape[1]):
+        vowel_weights = {v: np.mean(Sxx[np.argmin(np.abs(f - low)):np.argmin(np.abs(f - high)), frame])
+                         for v, (low, high) in audio2vmd.VOWEL_RANGES.items()}
+        total_weight = sum(vowel_weights.values())
+        if total_weight > 0:
+            vowel_weights = {v: w / total_weight for v, w in vowel_weights.items()}
+        vowel_weights_history.append(vowel_weights)
+        if len(vowel_weights_history) > smoothing_window:
+            vowel_weights_history.pop(0)
+        smoothed_weights = {v: np.mean([w[v] for w in vowel_weights_history]) for v in vowel_weights}
+
+        energy = np.sum(Sxx[:, frame])
+        if energy > 0.01 * max_Sxx:
+            energy_scale = np.clip(energy / max_Sxx, 0, 1) ** 0.5
+            adjusted_weights = audio2vmd.adjust_vowel_weights(smoothed_weights, config)
+            frame_weights.append([min(weight * energy_scale, 1.0) for weight in adjusted_weights.values()])
+        else:
+            frame_weights.append([0] * len(vowel_weights))
+    return frame_weights
+
+def benchmark_vowel_weights(input_file, config, seconds=0):
+    """
+    Time working out the vowel weights of every frame of input_file with compute_vowel_weights,
+    compared to the frame by frame loop audio_to_vmd used before, and check both give exactly the same weights.
+    (the frame by frame loop could only smooth with a mean, so that's used for both)
+    """
+    config = dict(config, smoothing_method='mean')
+    sample_rate, audio_chunks = audio2vmd.read_audio_chunks(input_file)
+    f, Sxx = audio2vmd.chunked_spectrogram(audio_chunks, sample_rate)
+    if seconds:
+        Sxx = Sxx[:, :int(seconds * 30)]
+    print(f"Benchmarking {os.path.basename(input_file)} ({Sxx.shape[1]} frames)")
+
+    start_time = time.time()
+    reference_weights = frame_by_frame_vowel_weights(f, Sxx, config, config.get('smoothing_window', 5))
+    loop_time = time.time() - start_time
+
+    start_time = time.time()
+    vowel_weights = audio2vmd.compute_vowel_weights(f, Sxx, config)
+    vectorized_time = time.time() - start_time
+
+    same_weights = np.array_equal(np.array(reference_weights, dtype=vowel_weights.dtype), vowel_weights)
+    print("\nMethod        Time")
+    print(f"{'frame loop':<12} {loop_time:>7.3f}s")
+    print(f"{'vectorized':<12} {vectorized_time:>7.3f}s")
+    print(f"Speed-up: {loop_time / vectorized_time:.1f}x")
+    print(f"Same weights: {same_weights}")
+    return loop_time, vectorized_time, same_weights
+
+def benchmark_smoothing_methods(input_file, config, seconds=0, methods=('mean', 'ema', 'median', 'none')):
+    """
+    Time working out the vowel weights of every frame of input_file with each smoothing_method,
+    and check every method only gives weights from 0 to 1 (no NaN, like a median with no weight left for a speech frame).
+    """
+    sample_rate, audio_chunks = audio2vmd.read_audio_chunks(input_file)
+    f, Sxx = audio2vmd.chunked_spectrogram(audio_chunks, sample_rate)
+    if seconds:
+        Sxx = Sxx[:, :int(seconds * 30)]
+    print(f"Benchmarking {os.path.basename(input_file)} ({Sxx.shape[1]} frames, smoothing_window {config.get('smoothing_window', 5)})")
+
+    results = {}
+    for method in methods:
+        start_time = time.time()
+        vowel_weights = audio2vmd.compute_vowel_weights(f, Sxx, dict(config, smoothing_method=method))
+        results[method] = (time.time() - start_time, bool(np.all((vowel_weights >= 0) & (vowel_weights <= 1))))
+
+    print("\nMethod     Time     Valid weights")
+    for method, (method_time, valid_weights) in results.items():
+        print(f"{method:<10} {method_time:>7.3f}s {valid_weights}")
+    return results
+
+def benchmark_band_energies(input_file, config):
+    """
+    Time the VMD analysis of input_file (spectrogram, vowel band means and energies) with the float32 spectrogram
+    and vowel filterbank (fast_band_energies), compared to scipy's float64 spectrogram, and compare the vowel weights.
+    """
+    results = {}
+    for fast_band_energies in (False, True):
+        sample_rate, audio_chunks = audio2vmd.read_audio_chunks(input_file)
+        start_time = time.time()
+        band_means, energy, max_Sxx = audio2vmd.analyze_vowel_frames(
+            audio2vmd.stream_spectrogram(audio_chunks, sample_rate, use_float32=fast_band_energies),
+            use_filterbank=fast_band_energies)
+        analysis_time = time.time() - start_time
+        is_speech = energy > 0.01 * max_Sxx
+        vowel_weights = audio2vmd.vowel_weights_from_features(band_means, energy, max_Sxx, config)
+        results[fast_band_energies] = (analysis_time, vowel_weights, is_speech)
+    print(f"Benchmarking {os.path.basename(input_file)} ({len(results[False][1])} frames)")
+
+    spectrogram_time, reference_weights, reference_speech = results[False]
+    filterbank_time, vowel_weights, is_speech = results[True]
+    weight_difference = np.abs(reference_weights.astype(np.float64) - vowel_weights)
+    print("\nMethod        Time")
+    print(f"{'spectrogram':<12} {spectrogram_time:>7.3f}s")
+    print(f"{'filterbank':<12} {filterbank_time:>7.3f}s")
+    print(f"Speed-up: {spectrogram_time / filterbank_time:.1f}x")
+    print(f"Vowel weight difference: mean {np.mean(weight_difference):.2e}, max {np.max(weight_difference):.2e}")
+    print(f"Frames with a different speech detection: {np.sum(reference_speech != is_speech)}")
+    return spectrogram_time, filterbank_time, float(np.max(weight_difference))
+
+def synthetic_speech(seconds, sample_rate=44100, seed=0):
+    # Speech-like test audio: a voice at a random pitch that moves between the vowel ranges every 100-250ms, with short pauses (mono int16)
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(seconds * sample_rate), dtype=np.float64)
+    start = 0
+    while start < len(audio):
+        length = int(rng.uniform(0.1, 0.25) * sample_rate)
+        if rng.random() > 0.2:
+            t = np.arange(min(length, len(audio) - start)) / sample_rate
+            pitch = rng.uniform(100, 250)
+            audio[start:start + len(t)] = np.sin(2 * np.pi * pitch * t) * 0.3
+            for low, high in list(audio2vmd.VOWEL_RANGES.values())[rng.integers(len(audio2vmd.VOWEL_RANGES))::2]:
+                audio[start:start + len(t)] += np.sin(2 * np.pi * rng.uniform(low, high) * t) * rng.uniform(0.2, 0.5)
+        start += length
+    return (audio * 12000).astype(np.int16)
+
+def benchmark_streaming(config, seconds=20, sample_rate=44100, packet_ms=10):
+    """
+    Feed synthetic speech through a pipe to the live lip sync (stream_lipsync, like --stream reads it) in packet_ms
+    long packets, once at real time to measure the latency and once as fast as possible to measure the throughput.
+    The latency of a frame is from when the last sample its weights need was written to when its weights are out.
+    """
+    audio = synthetic_speech(seconds, sample_rate)
+    frame_rate = config.get('vmd_frame_rate', 30)
+    window_size = config.get('analysis_window_size', 0) or sample_rate // frame_rate
+    packet_length = max(int(sample_rate * packet_ms / 1000), 1)
+    print(f"Benchmarking the live lip sync with {seconds}s of synthetic speech in {packet_ms}ms packets")
+
+    results = {}
+    for realtime in (True, False):
+        read_fd, write_fd = os.pipe()
+        packet_ends = np.append(np.arange(packet_length, len(audio), packet_length), len(audio))
+        write_times = np.zeros(len(packet_ends))
+
+        def write_packets():
+            start_time = time.perf_counter()
+            packet_start = 0
+            for packet, packet_end in enumerate(packet_ends):
+                if realtime:
+                    time.sleep(max(start_time + packet_end / sample_rate - time.perf_counter(), 0))
+                data = audio[packet_start:packet_end].tobytes()
+                while data:
+                    data = data[os.write(write_fd, data):]
+                write_times[packet] = time.perf_counter()
+                packet_start = packet_end
+            os.close(write_fd)
+
+        writer = threading.Thread(target=write_packets)
+        start_time = time.perf_counter()
+        writer.start()
+        latencies = []
+        with os.fdopen(read_fd, 'rb') as source:
+            for first_frame, vowel_weights in audio2vmd.stream_lipsync(audio2vmd.read_pcm_stream(source.read1), sample_rate, config):
+                out_time = time.perf_counter()
+                frames = np.arange(first_frame, first_frame + len(vowel_weights))
+                # the last sample each frame needs: the end of the frame, or of its window
+                needed = np.maximum((frames + 1) * sample_rate // frame_rate,
+                                    audio2vmd.frame_window_starts(frames, sample_rate, frame_rate, window_size) + window_size)
+                packets = np.minimum(np.searchsorted(packet_ends, needed), len(packet_ends) - 1)
+                latencies.append(out_time - write_times[packets])
+        total_time = time.perf_counter() - start_time
+        writer.join()
+        results[realtime] = (total_time, np.concatenate(latencies) * 1000)
+
+    frame_ms = 1000 / frame_rate
+    _, latencies = results[True]
+    throughput_time, _ = results[False]
+    print("\nMethod        Time")
+    print(f"{'realtime':<12} {results[True][0]:>7.3f}s")
+    print(f"{'unpaced':<12} {throughput_time:>7.3f}s")
+    print(f"Throughput: {seconds / throughput_time:.1f}x real time ({len(latencies)} frames)")
+    print(f"Latency: mean {np.mean(latencies):.2f}ms, median {np.median(latencies):.2f}ms, "
+          f"95% {np.percentile(latencies, 95):.2f}ms, max {np.max(latencies):.2f}ms ({np.max(latencies) / frame_ms:.2f} frames)")
+    return seconds / throughput_time, float(np.percentile(latencies, 95))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark audio2vmd settings on an audio file.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    lipsync_parser = subparsers.add_parser("lipsync-profile", help="Compare the 'full' and 'lipsync' separation profiles")
+    lipsync_parser.add_argument("input", help="Audio file to benchmark with")
+    lipsync_parser.add_argument("--seconds", type=float, default=0, help="Only use the first N seconds of the audio (0 = all)")
+    lipsync_parser.add_argument("--config", "-c", default="config.yaml", help="Path to configuration file")
+
+    backends_parser = subparsers.add_parser("backends", help="Compare the separator backends and precisions to eager float32")
+    backends_parser.add_argument("input", help="Audio file to benchmark with")
+    backends_parser.add_argument("--backends", nargs='+', help="backend:precision pairs to compare, like torchscript:int8 onnx:float32 (default: all)")
+    backends_parser.add_argument("--seconds", type=float, default=0, help="Only use the first N seconds of the audio (0 = all)")
+    backends_parser.add_argument("--config", "-c", default="config.yaml", help="Path to configuration file")
+
+    silence_parser = subparsers.add_parser("silence", help="Compare the vectorized silence detection to the slice by slice one")
+    silence_parser.add_argument("input", help="Audio file to benchmark with")
+    silence_parser.add_argument("--seconds", type=float, default=300, help="Length of audio to search, like max_duration (0 = all)")
+    silence_parser.add_argument("--min-silence-length", type=int, default=300, help="Minimum silence length in milliseconds")
+    silence_parser.add_argument("--silence-threshold", type=float, default=-60, help="Silence threshold in dB")
+    silence_parser.add_argument("--config", "-c", default="config.yaml", help="Path to configuration file")
+
+    split_parser = subparsers.add_parser("split", help="Compare finding the split points with one silence map to searching each segment")
+    split_parser.add_argument("input", help="Audio file to benchmark with")
+    split_parser.add_argument("--max-duration", type=int, default=300, help="Maximum part length in seconds, like max_duration")
+    split_parser.add_argument("--min-silence-length", type=int, default=300, help="Minimum silence length in milliseconds")
+    split_parser.add_argument("--silence-threshold", type=float, default=-60, help="Silence threshold in dB")
+    split_parser.add_argument("--config", "-c", default="config.yaml", help="Path to configuration file")
+
+    vowels_parser = subparsers.add_parser("vowels", help="Compare the vectorized vowel weights to the frame by frame loop")
+    vowels_parser.add_argument("input", help="Audio file to benchmark with")
+    vowels_parser.add_argument("--seconds", type=float, default=0, help="Only use the first N seconds of the audio (0 = all)")
+    vowels_parser.add_argument("--config", "-c", default="config.yaml", help="Path to configuration file")
+
+    smoothing_parser = subparsers.add_parser("smoothing", help="Compare the smoothing methods and check their vowel weights are valid")
+    smoothing_parser.add_argument("input", help="Audio file to benchmark with")
+    smoothing_parser.add_argument("--seconds", type=float, default=0, help="Only use the first N seconds of the audio (0 = all)")
+    smoothing_parser.add_argument("--window", type=int, help="smoothing_window to use (default: the one in the configuration)")
+    smoothing_parser.add_argument("--config", "-c", default="config.yaml", help="Path to configuration file")
+
+    band_parser = subparsers.add_parser("band-energies", help="Compare the float32 vowel filterbank analysis to scipy's float64 spectrogram")
+    band_parser.add_argument("input", help="Audio file to benchmark with")
+    band_parser.add_argument("--config", "-c", default="config.yaml", help="Path to configuration file")
+
+    stream_parser = subparsers.add_parser("stream", help="Measure the latency and throughput of the live lip sync (--stream) on synthetic speech")
+    stream_parser.add_argument("--seconds", type=float, default=20, help="Length of the synthetic speech")
+    stream_parser.add_argument("--sample-rate", type=int, default=44100, help="Sample rate of the synthetic speech")
+    stream_parser.add_argument("--packet-ms", type=float, default=10, help="Length of each packet of audio written to the pipe")
+    stream_parser.add_argument("--config", "-c", default="config.yaml", help="Path to configuration file")
+
+    args = parser.parse_args()
+    config = audio2vmd.load_config(args.config)
+
+    if args.benchmark == "lipsync-profile":
+        benchmark_lipsync_profile(args.input, config, args.seconds)
+    elif args.benchmark == "backends":
+        backends = [tuple(pair.split(":", 1)) for pair in args.backends] if args.backends else None
+        benchmark_backends(args.input, config, backends, args.seconds)
+    elif args.benchmark == "silence":
+        benchmark_silence_detection(args.input, args.seconds, args.min_silence_length, args.silence_threshold)
+    elif args.benchmark == "split":
+        benchmark_split_points(args.input, args.max_duration, args.min_silence_length, args.silence_threshold)
+    elif args.benchmark == "vowels":
+        benchmark_vowel_weights(args.input, config, args.seconds)
+    elif args.benchmark == "smoothing":
+        benchmark_smoothing_methods(args.input, dict(config, smoothing_window=args.window or config.get('smoothing_window', 5)), args.seconds)
+    elif args.benchmark == "band-energies":
+        benchmark_band_energies(args.input, config)
+    elif args.benchmark == "stream":
+        benchmark_streaming(config, args.seconds, args.sample_rate, args.packet_ms)